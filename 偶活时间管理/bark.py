@@ -0,0 +1,204 @@
+import sys
+import time
+import random
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import metrics
+
+# Bark 服务器地址
+BARK_SERVER = "https://api.day.app"
+
+# 同一个Bark服务器最多同时发送的请求数
+MAX_PER_HOST = 4
+# 每个Bark服务器每秒最多发送的请求数，以及允许的突发数量
+RATE_PER_SECOND = 5
+BURST = 10
+# 5xx 或超时后的重试次数和初始退避时间（秒）
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5
+REQUEST_TIMEOUT = 5
+
+# GET URL 超过这个长度时改用 POST JSON 接口，避免被服务器或代理拒绝
+MAX_URL_LENGTH = 2000
+# 推送正文的实际上限（APNs 负载总共 4KB，还要留给标题等字段）
+MAX_BODY_BYTES = 3000
+
+# 推送指标：每次HTTP请求的耗时和状态码（超时、连接失败记为 timeout/connection_error），
+# 重试次数，以及每条推送从提交到完成（包括限速等待和重试）的耗时和结果
+REQUEST_SECONDS = metrics.histogram('timeing_bark_request_seconds', "Bark HTTP请求耗时（秒）")
+RESPONSES = metrics.counter('timeing_bark_responses_total', "Bark 响应次数，按状态码", ['status'])
+RETRIES = metrics.counter('timeing_bark_retries_total', "Bark 推送重试次数")
+PUSH_SECONDS = metrics.histogram('timeing_bark_push_seconds', "一条推送从提交到完成的耗时（秒），包括限速等待和重试")
+PUSHES = metrics.counter('timeing_bark_pushes_total', "推送结果，result 为 ok 或 failed", ['result'])
+
+def build_url(bark_key, title, body, group=None, server=BARK_SERVER):
+    """构建Bark推送URL"""
+    url = f"{server}/{bark_key}/{urllib.parse.quote(title)}/{urllib.parse.quote(body)}"
+    if group:
+        url += f"?group={urllib.parse.quote(group)}"
+    return url
+
+def build_request(bark_key, title, body, group=None, server=BARK_SERVER):
+    """构建推送请求，返回 (url, payload)
+
+    payload 为 None 时用 GET 发送 url；URL 太长时改用 POST /push 接口，payload 为 JSON 数据
+    """
+    url = build_url(bark_key, title, body, group=group, server=server)
+    if len(url) <= MAX_URL_LENGTH:
+        return url, None
+    payload = {'device_key': bark_key, 'title': title, 'body': body}
+    if group:
+        payload['group'] = group
+    return f"{server}/push", payload
+
+def body_size(text):
+    """推送正文按UTF-8编码后的字节数"""
+    return len(text.encode('utf-8'))
+
+class TokenBucket:
+    """令牌桶限速器，线程安全"""
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """取一个令牌，没有令牌时等待"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+class PushResult:
+    """一次推送的结果"""
+    def __init__(self, label, status_code=None, error=None, attempts=0):
+        self.label = label
+        self.status_code = status_code
+        self.error = error
+        self.attempts = attempts
+
+    @property
+    def ok(self):
+        return self.status_code == 200
+
+class BarkDispatcher:
+    """Bark推送分发器
+
+    所有推送共用一个保持连接的 requests.Session，由线程池并发发送；
+    每个Bark服务器有自己的并发上限和令牌桶，5xx 和超时按指数退避重试。
+    """
+    def __init__(self, max_workers=16, max_per_host=MAX_PER_HOST,
+                 rate=RATE_PER_SECOND, burst=BURST, max_retries=MAX_RETRIES):
+        # requests 导入较慢，第一次推送时才导入，监控启动时不需要等待
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.timeout_error = requests.exceptions.Timeout
+        self.retry_errors = (requests.exceptions.Timeout, requests.exceptions.ConnectionError)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_workers, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bark")
+        self.max_per_host = max_per_host
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.hosts = {}
+        self.lock = threading.Lock()
+        self.stats = {'sent': 0, 'failed': 0, 'retries': 0}
+
+    def _host_limits(self, url):
+        host = urllib.parse.urlsplit(url).netloc
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = (threading.BoundedSemaphore(self.max_per_host),
+                                    TokenBucket(self.rate, self.burst))
+            return self.hosts[host]
+
+    def _count(self, key, n=1):
+        with self.lock:
+            self.stats[key] += n
+
+    def _send(self, url, label, payload):
+        start = time.perf_counter()
+        result = self._send_with_retries(url, label, payload)
+        PUSH_SECONDS.observe(time.perf_counter() - start)
+        PUSHES.inc(result='ok' if result.ok else 'failed')
+        return result
+
+    def _send_with_retries(self, url, label, payload):
+        semaphore, bucket = self._host_limits(url)
+        attempt = 0
+        while True:
+            attempt += 1
+            bucket.acquire()
+            try:
+                with semaphore, REQUEST_SECONDS.time():
+                    if payload is None:
+                        response = self.session.get(url, timeout=REQUEST_TIMEOUT)
+                    else:
+                        response = self.session.post(url, json=payload, timeout=REQUEST_TIMEOUT)
+                RESPONSES.inc(status=str(response.status_code))
+                if response.status_code < 500 or attempt > self.max_retries:
+                    self._count('sent' if response.status_code == 200 else 'failed')
+                    return PushResult(label, status_code=response.status_code, attempts=attempt)
+                error = f"状态码 {response.status_code}"
+            except self.retry_errors as e:
+                RESPONSES.inc(status='timeout' if isinstance(e, self.timeout_error) else 'connection_error')
+                if attempt > self.max_retries:
+                    self._count('failed')
+                    return PushResult(label, error=str(e), attempts=attempt)
+                error = str(e)
+            except Exception as e:
+                RESPONSES.inc(status='error')
+                self._count('failed')
+                return PushResult(label, error=str(e), attempts=attempt)
+
+            # 指数退避，加一点随机抖动避免同时重试
+            delay = BACKOFF_BASE * (2 ** (attempt - 1)) * (1 + random.random() / 2)
+            print(f"推送 {label} 失败({error})，{delay:.1f}秒后第{attempt}次重试")
+            sys.stdout.flush()
+            self._count('retries')
+            RETRIES.inc()
+            time.sleep(delay)
+
+    def stats_snapshot(self):
+        """返回推送统计的副本"""
+        with self.lock:
+            return dict(self.stats)
+
+    def submit(self, url, label="", payload=None):
+        """提交一个推送，返回 Future，结果为 PushResult；有 payload 时以 POST JSON 发送"""
+        return self.executor.submit(self._send, url, label, payload)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def get_dispatcher():
+    """获取进程内共用的推送分发器"""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = BarkDispatcher()
+        return _dispatcher
+
+def wait_all(futures):
+    """等待一批推送完成，返回 PushResult 列表"""
+    if not futures:
+        return []
+    wait(futures)
+    return [future.result() for future in futures]
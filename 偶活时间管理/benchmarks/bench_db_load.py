@@ -0,0 +1,48 @@
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import timetable_db
+from synthetic_corpus import CITIES, VENUES
+
+def synthetic_events(event_count, acts_per_event, seed=0):
+    """生成 load_all 使用的活动行，每天10个活动"""
+    rng = random.Random(seed)
+    events = []
+    for i in range(event_count):
+        event_date = f"2025-{1 + i // 300 % 12:02d}-{1 + i // 10 % 28:02d}"
+        day_start = timetable_db.to_minutes(f"{event_date} 00:00")
+        t = day_start + 11 * 60
+        acts = []
+        for _ in range(acts_per_event):
+            length = rng.choice([15, 20, 25, 30])
+            acts.append((f"团体{rng.randint(1, 500)}", t, t + length))
+            t += length
+        city = rng.choice(CITIES)
+        events.append((f"合成活动 Vol.{i}", event_date, city, rng.choice(VENUES), timetable_db.city_timezone(city), acts))
+    return events
+
+def main():
+    parser = argparse.ArgumentParser(description="测试数据库完整重建的写入速度是否随演出数线性增长")
+    parser.add_argument('--events', type=int, nargs='+', default=[500, 2000, 8000])
+    parser.add_argument('--acts', type=int, default=20, help="每个活动的团体数")
+    args = parser.parse_args()
+
+    print(f"{'活动数':>8}{'演出数':>10}{'耗时':>10}{'演出/秒':>12}")
+    for event_count in args.events:
+        events = synthetic_events(event_count, args.acts)
+        with tempfile.TemporaryDirectory() as tmp:
+            conn = timetable_db.connect_writer(os.path.join(tmp, timetable_db.DB_FILE))
+            start = time.perf_counter()
+            rows = timetable_db.load_all(conn, events)
+            elapsed = time.perf_counter() - start
+            conn.close()
+        print(f"{event_count:>8}{rows:>10}{elapsed:>9.3f}s{rows / elapsed:>12,.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+import contextlib
+import io
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import generate_timetable
+from synthetic_corpus import generate_corpus
+
+def time_parse(file_paths, jobs, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            generate_timetable.parse_files(file_paths, jobs)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="测试并行解析 Data 文件的速度随文件数和进程数的变化")
+    parser.add_argument('--files', type=int, nargs='+', default=[50, 200, 800])
+    parser.add_argument('--jobs', type=int, nargs='+', default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument('--acts', type=int, default=40, help="每个活动的团体数")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    jobs_list = sorted(set(args.jobs))
+    print(f"{'文件数':>8}" + "".join(f"{f'jobs={jobs}':>14}" for jobs in jobs_list))
+    for file_count in args.files:
+        with tempfile.TemporaryDirectory() as data_dir:
+            generate_corpus(data_dir, dates=file_count // 10 or 1, events_per_day=min(10, file_count),
+                            acts_per_event=args.acts)
+            file_paths = sorted(os.path.join(data_dir, f) for f in os.listdir(data_dir))
+            row = f"{len(file_paths):>8}"
+            baseline = None
+            for jobs in jobs_list:
+                elapsed = time_parse(file_paths, jobs, args.repeat)
+                baseline = baseline or elapsed
+                row += f"{elapsed:>8.3f}s x{baseline / elapsed:<4.1f}"
+            print(row)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+import contextlib
+import io
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import generate_timetable
+from synthetic_corpus import generate_corpus
+
+def main():
+    parser = argparse.ArgumentParser(description="测试出演表解析器的吞吐量（行/秒、文件/秒）")
+    parser.add_argument('--files', type=int, default=2000)
+    parser.add_argument('--acts', type=int, default=40, help="每个活动的团体数")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        generate_corpus(data_dir, dates=args.files // 10 or 1, events_per_day=min(10, args.files),
+                        acts_per_event=args.acts, tokutenkai=True)
+        file_paths = sorted(os.path.join(data_dir, f) for f in os.listdir(data_dir))
+        # 先把文件读进内存，只测解析本身；再单独测包含读文件的 parse_file
+        contents = []
+        for file_path in file_paths:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                contents.append(f.read().splitlines())
+        line_count = sum(len(lines) for lines in contents)
+
+        best_lines = best_files = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                for lines in contents:
+                    generate_timetable.parse_lines(lines)
+            elapsed = time.perf_counter() - start
+            best_lines = elapsed if best_lines is None else min(best_lines, elapsed)
+
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                for file_path in file_paths:
+                    generate_timetable.parse_file(file_path)
+            elapsed = time.perf_counter() - start
+            best_files = elapsed if best_files is None else min(best_files, elapsed)
+
+    print(f"{len(file_paths)} 个文件，{line_count} 行")
+    print(f"parse_lines: {best_lines:.3f}s  {line_count / best_lines:,.0f} 行/秒")
+    print(f"parse_file:  {best_files:.3f}s  {len(file_paths) / best_files:,.0f} 文件/秒")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# 各个入口导入的模块：GUI、配置界面、活动监控、生成时间表、监控命令行，
+# 以及只需要配置和数据库查询的无界面部分
+ENTRY_POINTS = {
+    'gui': '主程序',
+    'config_gui': 'config_gui',
+    'monitor': 'current_activities',
+    'generate': 'generate_timetable',
+    'monitor_cli': 'monitor_api',
+    'core': 'config',
+}
+
+def parse_importtime(stderr, module):
+    """解析 -X importtime 的输出，返回 (模块累计微秒, [(直接依赖, 累计微秒), ...])"""
+    deps = []
+    # 每行格式为 "import time: 自身 | 累计 | 模块名"，模块名前每多两个空格表示多一层嵌套
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue  # 表头
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        if depth == 0:
+            if name == module:
+                return int(cumulative), sorted(deps, key=lambda dep: -dep[1])
+            deps = []
+        elif depth == 1:
+            deps.append((name, int(cumulative)))
+    raise RuntimeError(f"importtime 输出中没有找到 {module}")
+
+def measure(module, repeat):
+    """冷启动导入一个模块 repeat 次，返回导入耗时、进程总耗时和最慢的直接依赖"""
+    import_ms, wall_ms = [], []
+    deps = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                                cwd=PROJECT_DIR, capture_output=True, text=True, encoding='utf-8')
+        wall_ms.append((time.perf_counter() - start) * 1000)
+        if result.returncode != 0:
+            raise RuntimeError(f"导入 {module} 失败:\n{result.stderr[-2000:]}")
+        cumulative, deps = parse_importtime(result.stderr, module)
+        import_ms.append(cumulative / 1000)
+    return {
+        'module': module,
+        'import_ms': statistics.median(import_ms),
+        'import_ms_min': min(import_ms),
+        'wall_ms': statistics.median(wall_ms),
+        'top_deps': [{'name': name, 'ms': us / 1000} for name, us in deps[:5]],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="用 -X importtime 测量各个入口的冷启动导入时间")
+    parser.add_argument('--entry', nargs='+', choices=sorted(ENTRY_POINTS), default=list(ENTRY_POINTS))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', metavar='FILE', help="把结果保存为JSON，便于比较不同版本")
+    args = parser.parse_args()
+
+    results = {}
+    for entry in args.entry:
+        result = measure(ENTRY_POINTS[entry], args.repeat)
+        results[entry] = result
+        deps = "，".join(f"{dep['name']} {dep['ms']:.1f}ms" for dep in result['top_deps'][:3])
+        print(f"{entry:12} {result['module']:20} 导入 {result['import_ms']:7.1f}ms  "
+              f"进程 {result['wall_ms']:7.1f}ms  最慢: {deps}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'python': sys.version.split()[0], 'repeat': args.repeat, 'results': results},
+                      f, ensure_ascii=False, indent=2)
+        print(f"结果已保存: {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import contextlib
+from datetime import timedelta
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, PROJECT_DIR)
+
+from synthetic_corpus import CITIES, add_corpus_arguments, corpus_options, generate_corpus
+
+# 完整的离线基准测试：生成合成语料，分阶段测量生成和查询的耗时，结果可以保存为JSON并与上一次比较。
+# 每个阶段在单独的子进程中运行（工作目录为临时目录，程序使用的相对路径都指向这里），
+# 所以峰值内存只包含这个阶段本身和它需要的准备工作：
+#   generate      generate_timetable.main() 完整重建，记录其中各阶段的耗时
+#   parse         逐个文件 parse_file
+#   db_load       build_event_rows + timetable_db.load_all 写入新数据库
+#   excel         逐个日期 render_date_sheet 并保存
+#   query_city    config.get_activities_by_city 随机城市和时刻
+#   query_monitor current_activities.query_activities（内存索引）随机用户和时刻
+STAGES = ['generate', 'parse', 'db_load', 'excel', 'query_city', 'query_monitor']
+
+# 与基准结果相比慢了这么多时标记为退化（延迟很短时波动较大，语料太小时可以调高）
+REGRESSION_THRESHOLD = 1.2
+
+def peak_rss_mb():
+    """当前进程的峰值内存（MB），无法获取时返回 None"""
+    try:
+        import resource
+    except ImportError:
+        return _windows_peak_rss_mb()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 的单位是 KB，macOS 是字节
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def _windows_peak_rss_mb():
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return None
+        return counters.PeakWorkingSetSize / (1024 * 1024)
+    except (AttributeError, OSError):
+        return None
+
+def latency_summary(samples):
+    """把每次调用的耗时（秒）汇总为毫秒的百分位数"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    return {
+        'count': len(ordered),
+        'mean_ms': statistics.fmean(ordered) * 1000,
+        'p50_ms': pick(0.50),
+        'p90_ms': pick(0.90),
+        'p99_ms': pick(0.99),
+        'max_ms': ordered[-1] * 1000,
+    }
+
+def timed_calls(func, items):
+    """依次调用 func(item)，返回每次的耗时和结果"""
+    samples, results = [], []
+    for item in items:
+        start = time.perf_counter()
+        results.append(func(item))
+        samples.append(time.perf_counter() - start)
+    return samples, results
+
+def stage_result(seconds, rows, unit, samples=None, **extra):
+    result = {'seconds': seconds, 'rows': rows, 'unit': unit,
+              'rows_per_sec': rows / seconds if seconds else None,
+              'latency': latency_summary(samples or [])}
+    result.update(extra)
+    return result
+
+# ---- 各阶段，在子进程中运行，工作目录为语料所在的临时目录 ----
+
+def _data_files():
+    import generate_timetable
+    found = generate_timetable.scan_data_files()
+    return found, [os.path.join(generate_timetable.data_dir, name) for name in found]
+
+def _parsed_files():
+    """解析全部文件，返回与清单格式相同的 {文件名: 条目}"""
+    import generate_timetable
+    found, paths = _data_files()
+    files = {}
+    for (file_name, (date, event_name)), path in zip(found.items(), paths):
+        lineup = generate_timetable.parse_file(path)
+        files[file_name] = {'date': date, 'event_name': event_name, 'schedule': lineup.schedule,
+                            'city': lineup.city, 'venue': lineup.venue, 'timezone': lineup.timezone}
+    return files
+
+def run_generate(args):
+    import generate_timetable
+    start = time.perf_counter()
+    summary = generate_timetable.main(full_rebuild=True, stream=args.stream, jobs=args.jobs)
+    seconds = time.perf_counter() - start
+    return stage_result(seconds, summary['rows'], '演出', files=summary['files'], dates=summary['dates'],
+                        timings=summary['timings'])
+
+def run_parse(args):
+    import generate_timetable
+    _, paths = _data_files()
+    best, samples, rows = None, [], 0
+    for _ in range(args.repeat):
+        run_samples, lineups = timed_calls(generate_timetable.parse_file, paths)
+        samples += run_samples
+        rows = sum(len(lineup.schedule) for lineup in lineups)
+        best = sum(run_samples) if best is None else min(best, sum(run_samples))
+    return stage_result(best, rows, '演出', samples, files=len(paths))
+
+def run_db_load(args):
+    import generate_timetable
+    import timetable_db
+    files = _parsed_files()
+    samples, rows = [], 0
+    for index in range(args.repeat):
+        db_file = f"bench_load_{index}.db"
+        start = time.perf_counter()
+        events = generate_timetable.build_event_rows(files, sorted(files))
+        conn = timetable_db.connect_writer(db_file)
+        try:
+            rows = timetable_db.load_all(conn, events)
+        finally:
+            conn.close()
+        samples.append(time.perf_counter() - start)
+    return stage_result(min(samples), rows, '演出', samples, events=len(files))
+
+def run_excel(args):
+    import generate_timetable
+    import excel_render
+    date_events = generate_timetable.group_by_date(_parsed_files())
+    timeline = excel_render.generate_timeline()
+    render = excel_render.stream_date_sheet if args.stream else excel_render.render_date_sheet
+    wb = excel_render.new_workbook(write_only=args.stream)
+    start = time.perf_counter()
+    samples, _ = timed_calls(lambda date: render(wb, date, date_events[date], timeline), sorted(date_events))
+    render_seconds = time.perf_counter() - start
+    save_start = time.perf_counter()
+    wb.save("bench.xlsx")
+    save_seconds = time.perf_counter() - save_start
+    rows = sum(len(event['schedule']) for events in date_events.values() for event in events)
+    return stage_result(render_seconds + save_seconds, rows, '演出', samples,
+                        sheets=len(date_events), render_seconds=render_seconds, save_seconds=save_seconds,
+                        stream=args.stream)
+
+def _query_times(args, rng):
+    """在语料日期范围内随机选择查询时刻（当地时间 10:00~23:00 之间）"""
+    first = corpus_options(args)['first_date']
+    return [f"{first + timedelta(days=rng.randrange(args.dates))} {rng.randint(10, 22):02d}:{rng.randrange(60):02d}"
+            for _ in range(args.queries)]
+
+def run_query_city(args):
+    import config
+    rng = random.Random(args.seed)
+    queries = list(zip((rng.choice(CITIES) for _ in range(args.queries)), _query_times(args, rng)))
+    config.get_activities_by_city(*queries[0])  # 打开只读连接、预编译语句
+    start = time.perf_counter()
+    samples, results = timed_calls(lambda query: config.get_activities_by_city(*query), queries)
+    seconds = time.perf_counter() - start
+    return stage_result(seconds, len(queries), '查询', samples, hits=sum(1 for result in results if result))
+
+def run_query_monitor(args):
+    import timetable_db
+    import current_activities
+    from user_store import get_store
+    # 每个城市一个用户，query_activities 按用户所在城市查询
+    users = {str(index): {'username': f"用户{index}", 'bark_key': 'N', 'city': city, 'enabled': True}
+             for index, city in enumerate(CITIES, 1)}
+    get_store().save({'users': users, 'active_user': '1'})
+    rng = random.Random(args.seed)
+    # 监控的时间只会向前走，按时间排序后内存索引每天只重新加载一次，和实际运行时一样
+    queries = sorted(((rng.choice(list(users)), timetable_db.to_minutes(query_time))
+                      for query_time in _query_times(args, rng)), key=lambda query: query[1])
+    current_activities.query_activities(*queries[0])  # 加载内存索引
+    start = time.perf_counter()
+    samples, results = timed_calls(lambda query: current_activities.query_activities(*query), queries)
+    seconds = time.perf_counter() - start
+    return stage_result(seconds, len(queries), '查询', samples, hits=sum(1 for result in results if result),
+                        index_reloads=current_activities.schedule_index.version)
+
+STAGE_FUNCTIONS = {
+    'generate': run_generate,
+    'parse': run_parse,
+    'db_load': run_db_load,
+    'excel': run_excel,
+    'query_city': run_query_city,
+    'query_monitor': run_query_monitor,
+}
+
+def run_worker(args):
+    """子进程入口：运行一个阶段，把结果作为一行JSON输出"""
+    output = sys.stdout
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+        result = STAGE_FUNCTIONS[args.worker](args)
+    result['peak_rss_mb'] = peak_rss_mb()
+    output.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+# ---- 主进程：生成语料、依次启动各阶段、汇总和比较结果 ----
+
+def worker_command(args, stage):
+    command = [sys.executable, os.path.abspath(__file__), '--worker', stage,
+               '--repeat', str(args.repeat), '--queries', str(args.queries), '--jobs', str(args.jobs),
+               '--dates', str(args.dates), '--first-date', args.first_date, '--seed', str(args.seed)]
+    if args.stream:
+        command.append('--stream')
+    return command
+
+def run_stage(args, stage, work_dir):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [PROJECT_DIR, os.environ.get('PYTHONPATH')])))
+    result = subprocess.run(worker_command(args, stage), cwd=work_dir, env=env,
+                            capture_output=True, text=True, encoding='utf-8')
+    if result.returncode != 0:
+        raise RuntimeError(f"阶段 {stage} 失败:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def format_stage(stage, result):
+    rate = f"{result['rows_per_sec']:>12,.0f} {result['unit']}/秒" if result['rows_per_sec'] else ""
+    line = f"{stage:14}{result['seconds']:>9.3f}s {rate:>18}"
+    latency = result.get('latency')
+    if latency:
+        line += f"  p50 {latency['p50_ms']:.3f}ms p90 {latency['p90_ms']:.3f}ms p99 {latency['p99_ms']:.3f}ms"
+    if result.get('peak_rss_mb'):
+        line += f"  峰值内存 {result['peak_rss_mb']:.0f}MB"
+    return line
+
+def compare(results, baseline_file, threshold=REGRESSION_THRESHOLD):
+    """与之前保存的结果比较各阶段耗时和 p99 延迟，返回退化的阶段"""
+    with open(baseline_file, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('corpus') != results['corpus']:
+        print("警告: 基准结果使用的语料参数不同，比较结果仅供参考")
+    regressions = []
+    print(f"\n与 {baseline_file} 比较（>1 表示变慢）:")
+    for stage, result in results['stages'].items():
+        old = baseline['stages'].get(stage)
+        if not old:
+            continue
+        ratios = {'耗时': result['seconds'] / old['seconds'] if old['seconds'] else None}
+        if result.get('latency') and old.get('latency') and old['latency']['p99_ms']:
+            ratios['p99'] = result['latency']['p99_ms'] / old['latency']['p99_ms']
+        text = "  ".join(f"{name} x{ratio:.2f}" for name, ratio in ratios.items() if ratio)
+        slower = any(ratio and ratio > threshold for ratio in ratios.values())
+        if slower:
+            regressions.append(stage)
+        print(f"{stage:14}{text}{'  <- 变慢' if slower else ''}")
+    return regressions
+
+def git_revision():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_DIR,
+                                capture_output=True, text=True, timeout=10)
+        return result.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="离线基准测试：生成合成语料，分阶段测量耗时、吞吐量、延迟百分位数和峰值内存")
+    add_corpus_arguments(parser)
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--repeat', type=int, default=3, help="parse/db_load 阶段的重复次数")
+    parser.add_argument('--queries', type=int, default=2000, help="查询阶段的查询次数")
+    parser.add_argument('--jobs', type=int, default=1, help="generate 阶段解析使用的进程数")
+    parser.add_argument('--stream', action='store_true', help="Excel使用流式写入模式")
+    parser.add_argument('--json', metavar='FILE', help="把结果保存为JSON")
+    parser.add_argument('--compare', metavar='FILE', help="与之前保存的JSON结果比较，有阶段变慢时返回非0")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help="比较时超过这个倍数视为变慢")
+    parser.add_argument('--worker', choices=STAGES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    options = corpus_options(args)
+    results = {
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'revision': git_revision(),
+        'time': time.strftime("%Y-%m-%d %H:%M:%S"),
+        'corpus': dict(options, first_date=args.first_date),
+        'settings': {'repeat': args.repeat, 'queries': args.queries, 'jobs': args.jobs, 'stream': args.stream},
+        'stages': {},
+    }
+    with tempfile.TemporaryDirectory() as work_dir:
+        count = generate_corpus(os.path.join(work_dir, 'Data'), **options)
+        print(f"生成 {count} 个出演表文件（{args.dates} 天 × {args.events_per_day} 个活动 × {args.acts} 个团体）")
+        # 查询阶段使用 generate 阶段生成的数据库
+        stages = list(args.stages)
+        if {'query_city', 'query_monitor'} & set(stages) and 'generate' not in stages:
+            run_stage(args, 'generate', work_dir)
+        for stage in STAGES:
+            if stage not in stages:
+                continue
+            result = run_stage(args, stage, work_dir)
+            results['stages'][stage] = result
+            print(format_stage(stage, result))
+            if stage == 'generate':
+                print("              " + "  ".join(f"{name} {seconds:.3f}s" for name, seconds in result['timings'].items()))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存: {args.json}")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
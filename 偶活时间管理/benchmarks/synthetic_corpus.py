@@ -0,0 +1,97 @@
+import os
+import random
+import argparse
+from datetime import date, datetime, timedelta
+
+# 生成离线测试用的 Data 目录：文件名、城市/场地表头和两种时间格式都与真实数据一致
+# 也可以直接运行，在指定目录生成一份语料：python synthetic_corpus.py 输出目录 --dates 30 --events-per-day 20
+
+CITIES = ["广州", "杭州", "上海", "深圳"]
+VENUES = ["SDLivehouse", "音乐唐人馆", "喜邻里", "UP青年向上展演中心"]
+
+# 文件使用的格式：1 为时间点 + 团体名，2 为时间范围 + 团体名，mixed 为两种格式交替
+FORMATS = ('mixed', '1', '2')
+
+def _fmt(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+def lineup_lines(acts, fmt, rng, start=11 * 60, tokutenkai=0):
+    """生成一个活动的出演表正文（不含城市/场地行）
+
+    tokutenkai 是结尾的特典会场数（True 等于 1）：第一种格式中每场特典会都像真实出演表一样
+    连续出现两次（第二次的时间是结束时间），第二种格式中每场写成一个时间范围
+    """
+    lines = []
+    t = start
+    for i in range(acts):
+        length = rng.choice([15, 20, 25, 30])
+        group = f"团体{rng.randint(1, 500)}"
+        if fmt == 1:
+            lines += [_fmt(t), group]
+        else:
+            lines += [f"{_fmt(t)}~{_fmt(t + length)}", group]
+        t += length
+    for _ in range(int(tokutenkai)):
+        if fmt == 1:
+            lines += [_fmt(t), "特典会", _fmt(t + 90), "特典会"]
+        else:
+            lines += [f"{_fmt(t)}~{_fmt(t + 90)}", "特典会"]
+        t += 90
+    if fmt == 1 and not tokutenkai:
+        # 第一种格式用最后一个时间点作为最后一个团体的结束时间
+        lines.append(_fmt(t))
+    return lines
+
+def generate_corpus(data_dir, dates=10, events_per_day=10, acts_per_event=12,
+                    seed=0, first_date=date(2025, 1, 1), tokutenkai=0, fmt='mixed'):
+    """在 data_dir 中生成合成的出演表文件，返回生成的文件数"""
+    rng = random.Random(seed)
+    os.makedirs(data_dir, exist_ok=True)
+    count = 0
+    for day in range(dates):
+        day_str = (first_date + timedelta(days=day)).strftime("%Y%m%d")
+        for event in range(events_per_day):
+            if fmt == 'mixed':
+                file_fmt = 1 if (day + event) % 2 == 0 else 2
+            else:
+                file_fmt = int(fmt)
+            lines = [f"城市：{rng.choice(CITIES)}", f"场地：{rng.choice(VENUES)}"]
+            lines += lineup_lines(acts_per_event, file_fmt, rng, tokutenkai=tokutenkai)
+            file_name = f"【{day_str}】合成活动 Vol.{event + 1}.txt"
+            with open(os.path.join(data_dir, file_name), 'w', encoding='utf-8') as f:
+                f.write("\n".join(lines))
+            count += 1
+    return count
+
+def add_corpus_arguments(parser):
+    """添加生成语料的命令行参数，bench_suite.py 也使用同样的参数"""
+    parser.add_argument('--dates', type=int, default=10, help="日期数")
+    parser.add_argument('--events-per-day', type=int, default=10, help="每天的活动数")
+    parser.add_argument('--acts', type=int, default=12, help="每个活动的团体数")
+    parser.add_argument('--tokutenkai', type=int, default=1, help="每个活动结尾的特典会场数")
+    parser.add_argument('--format', choices=FORMATS, default='mixed', help="出演表格式")
+    parser.add_argument('--first-date', default="2025-01-01", help="第一天的日期 YYYY-MM-DD")
+    parser.add_argument('--seed', type=int, default=0)
+
+def corpus_options(args):
+    """把命令行参数转换为 generate_corpus 的关键字参数"""
+    return {
+        'dates': args.dates,
+        'events_per_day': args.events_per_day,
+        'acts_per_event': args.acts,
+        'tokutenkai': args.tokutenkai,
+        'fmt': args.format,
+        'first_date': datetime.strptime(args.first_date, "%Y-%m-%d").date(),
+        'seed': args.seed,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="生成合成的出演表语料（Data目录格式）")
+    parser.add_argument('data_dir', help="输出目录")
+    add_corpus_arguments(parser)
+    args = parser.parse_args()
+    count = generate_corpus(args.data_dir, **corpus_options(args))
+    print(f"已在 {args.data_dir} 生成 {count} 个出演表文件")
+
+if __name__ == "__main__":
+    main()
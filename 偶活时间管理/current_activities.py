@@ -1,23 +1,99 @@
-import sqlite3
-from datetime import datetime
-import requests
-import urllib.parse
-import time
+from datetime import datetime, timezone
 import signal
 import sys
 import os
-import json
+import heapq
+import argparse
+import importlib.util
+import threading
 
 # 强制立即刷新输出
 sys.stdout.reconfigure(line_buffering=True)
 sys.stderr.reconfigure(line_buffering=True)
 
-# 引入配置模块
-from config import get_active_user, get_activities_by_city
+# 用户配置缓存，配置文件变化时自动重新加载
+from user_store import get_store
+from schedule_index import ScheduleIndex
+import bark
+from push_ledger import PushLedger
+import timetable_db
+import monitor_api
+import metrics
 
 # 定义全局变量，用于控制程序循环
 running = True
 
+# 收到退出信号或接口请求时置位，用于立即结束等待
+wake_event = threading.Event()
+# 接口请求重新加载时间表和用户配置
+reload_event = threading.Event()
+
+# Windows上阻塞在 Event.wait 中的主线程收不到 Ctrl+C/Ctrl+Break，按这个秒数分段等待；
+# 每段只是重新计算剩余时间，不读文件也不查数据库
+WINDOWS_WAIT_SLICE = 1
+
+# 内存中的时间表索引，数据库变化时自动重新加载
+schedule_index = ScheduleIndex()
+
+# 每个Bark Key已推送的活动状态，用于去重
+push_ledger = PushLedger()
+
+# 用户配置，只在预定的唤醒时检查配置文件是否被修改；配置界面保存后通过 POST /reload 立即通知监控
+user_store = get_store()
+
+class MonitorState:
+    """活动监控的运行状态，主循环更新，本地HTTP接口读取"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = None
+        self.lead_minutes = 0
+        self.cities = []
+        self.user_count = 0
+        self.last_check = None
+        self.next_wakeup = None
+        self.next_city = None
+        self.rounds = 0
+        self.last_round = None
+
+    def update(self, **fields):
+        with self.lock:
+            for name, value in fields.items():
+                setattr(self, name, value)
+
+    def record_round(self, ok, failed):
+        """记录一轮推送的结果"""
+        with self.lock:
+            self.rounds += 1
+            self.last_round = {'time': _format_time(_now()), 'ok': ok, 'failed': failed}
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'started_at': _format_time(self.started_at),
+                'lead_minutes': self.lead_minutes,
+                'cities': list(self.cities),
+                'user_count': self.user_count,
+                'last_check': _format_time(self.last_check),
+                'next_wakeup': _format_time(self.next_wakeup),
+                'next_city': self.next_city,
+                'rounds': self.rounds,
+                'last_round': self.last_round,
+            }
+
+def _format_time(value):
+    return value.strftime("%Y-%m-%d %H:%M:%S") if value else None
+
+# 监控程序的日志和等待时间用服务器的当地时间（带时区）；查询时间表统一换算成 UTC 整数分钟，
+# 所以服务器和活动不在同一个时区、或者服务器时区有夏令时也不影响换场判断
+def _now():
+    return datetime.now().astimezone()
+
+def _local_time(minute):
+    """把 UTC 整数分钟转换为服务器当地时间"""
+    return timetable_db.from_minutes(minute, timezone.utc).astimezone()
+
+monitor_state = MonitorState()
+
 # 处理信号
 def signal_handler(sig, frame):
     global running
@@ -32,6 +108,7 @@ def signal_handler(sig, frame):
     print(f'\n检测到信号 {signal_name}，程序将在当前循环结束后退出...')
     sys.stdout.flush()
     running = False
+    wake_event.set()
 
 # 注册所有可能的终止信号
 def register_signals():
@@ -43,74 +120,21 @@ def register_signals():
 def get_current_activities():
     """查询当前正在进行的活动，根据当前用户配置筛选城市"""
     # 获取当前活动用户配置
-    user = get_active_user()
-    user_city = user['city']
-    print(f"当前用户: {user['username']}, 所在城市: {user_city}")
+    user_store.refresh()
+    user = user_store.active_user()
+    user_city = user.city
+    print(f"当前用户: {user.username}, 所在城市: {user_city}")
     sys.stdout.flush()
     
-    # 获取当前时间
-    now = datetime.now()
-    current_time = now.strftime("%Y-%m-%d %H:%M")
-    
-    # 根据城市获取活动
-    current_activities = get_activities_by_city(user_city, current_time)
+    # 从内存索引中查找正在进行的活动及其下一个团体
+    result = schedule_index.current_and_next(user_city)
     
     # 如果没有活动，返回信息
-    if not current_activities:
+    if not result:
         print(f"{user_city}当前没有正在进行的活动")
         sys.stdout.flush()
         return None
     
-    # 连接数据库，获取每个活动的下一个团体
-    conn = sqlite3.connect('timetable.db')
-    cursor = conn.cursor()
-    
-    # 获取每个活动的下一个团体
-    result = []
-    for activity in current_activities:
-        # 数据库结构是 (event_name, group_name, start_time, end_time, city, venue)
-        event_name = activity[0]
-        group_name = activity[1]
-        start_time = activity[2]
-        end_time = activity[3]
-        
-        # 获取当前活动的所有团体按时间排序
-        cursor.execute("""
-            SELECT group_name, start_time 
-            FROM activities 
-            WHERE event_name = ?
-            ORDER BY start_time
-        """, (event_name,))
-        
-        all_groups = cursor.fetchall()
-        
-        # 查找当前团体在排序后的列表中的位置
-        current_index = -1
-        for i, (g_name, g_start) in enumerate(all_groups):
-            if g_name == group_name and g_start == start_time:
-                current_index = i
-                break
-        
-        # 获取下一个团体，如果当前是最后一个则返回"无"
-        next_group_name = "无"
-        next_start_time = "无"
-        if current_index != -1 and current_index < len(all_groups) - 1:
-            next_group_name = all_groups[current_index + 1][0]
-            next_start_time = all_groups[current_index + 1][1].split()[1]  # 只取时间部分
-        
-        # 添加到结果列表，但不打印详细信息
-        result.append({
-            'event_name': event_name,
-            'group_name': group_name,
-            'start_time': start_time.split()[1],  # 只取时间部分
-            'end_time': end_time.split()[1],  # 只取时间部分
-            'next_group': next_group_name,
-            'next_start_time': next_start_time
-        })
-    
-    # 关闭数据库连接
-    conn.close()
-    
     return result
 
 def format_output(activities):
@@ -136,265 +160,449 @@ def format_output(activities):
     
     sys.stdout.flush()
 
+def build_push(bark_key, activity):
+    """根据活动信息构建Bark推送请求，返回 (url, payload)"""
+    # 构建推送内容
+    event_name = activity['event_name']
+    group_name = activity['group_name']
+    end_time = activity['end_time']  # 已经只有时间部分了
+    next_group = activity['next_group']
+    next_start_time = activity['next_start_time']
+    
+    # 标题使用活动名称
+    title = f"{event_name}"
+    
+    # 正文使用当前团体和下一个团体信息
+    body = f"{group_name} ({activity['start_time']}-{end_time})"
+    
+    # 添加下一个团体信息
+    if next_group != "无":
+        body += f"\n下一个: {next_group} ({next_start_time})"
+    
+    # 使用活动名作为分组名
+    return bark.build_request(bark_key, title, body, group=event_name)
+
+def build_batch_message(city, activities, ended=()):
+    """把一个用户的所有活动变化合并成一条推送，返回 (标题, 正文)
+
+    正文超过 bark.MAX_BODY_BYTES 时先去掉"下一个"信息，仍然太长则只保留放得下的活动
+    """
+    # 只列出状态变化的活动，没变化的活动不在这条推送里，所以标题说"有更新"而不是"正在进行"
+    parts = []
+    if activities:
+        parts.append(f"{len(activities)}个活动有更新")
+    if ended:
+        parts.append(f"{len(ended)}个活动已结束")
+    title = f"{city} {'，'.join(parts)}"
+    
+    full_lines = []
+    short_lines = []
+    for activity in activities:
+        line = f"{activity['event_name']}: {activity['group_name']} ({activity['start_time']}-{activity['end_time']})"
+        short_lines.append(line)
+        if activity['next_group'] != "无":
+            line += f"\n  下一个: {activity['next_group']} ({activity['next_start_time']})"
+        full_lines.append(line)
+    for event_name in ended:
+        full_lines.append(f"{event_name}: 已结束")
+        short_lines.append(f"{event_name}: 已结束")
+    
+    for lines in (full_lines, short_lines):
+        body = "\n".join(lines)
+        if bark.body_size(body) <= bark.MAX_BODY_BYTES:
+            return title, body
+    
+    # 逐条加入，直到放不下为止
+    body = ""
+    for i, line in enumerate(short_lines):
+        more = f"\n……另有{len(short_lines) - i}个活动"
+        candidate = f"{body}\n{line}" if body else line
+        if bark.body_size(candidate + more) > bark.MAX_BODY_BYTES:
+            return title, body + more
+        body = candidate
+    return title, body
+
+def report_push(future):
+    """打印一次推送的结果"""
+    try:
+        result = future.result()
+    except Exception as e:
+        print(f"推送失败: {str(e)}")
+        sys.stdout.flush()
+        return
+    
+    if result.ok:
+        print(f"已推送 {result.label} 到Bark")
+    elif result.status_code is not None:
+        print(f"推送到Bark失败: {result.status_code}")
+    else:
+        print(f"网络错误，推送失败: {result.error}")
+    sys.stdout.flush()
+
 def send_to_bark(activities):
     """使用Bark将活动信息发送到手机"""
     if not activities:
         return
     
     # 获取当前用户的Bark Key
-    user = get_active_user()
-    bark_key = user['bark_key']
+    user_store.refresh()
+    bark_key = user_store.active_user().bark_key
     
+    dispatcher = bark.get_dispatcher()
+    futures = []
     for activity in activities:
-        try:
-            # 构建推送内容
-            event_name = activity['event_name']
-            group_name = activity['group_name']
-            end_time = activity['end_time']  # 已经只有时间部分了
-            next_group = activity['next_group']
-            next_start_time = activity['next_start_time']
-            
-            # 构建完整URL - 直接在URL中使用中文，Bark会自动处理编码
-            # 标题使用活动名称
-            title = f"{event_name}"
-            
-            # 正文使用当前团体和下一个团体信息
-            body = f"{group_name} ({activity['start_time']}-{end_time})"
-            
-            # 添加下一个团体信息
-            if next_group != "无":
-                body += f"\n下一个: {next_group} ({next_start_time})"
-            
-            # URL编码
-            encoded_title = urllib.parse.quote(title)
-            encoded_body = urllib.parse.quote(body)
-            encoded_group = urllib.parse.quote(event_name)  # 使用活动名作为分组名
-            
-            # 构建URL
-            url = f"https://api.day.app/{bark_key}/{encoded_title}/{encoded_body}?group={encoded_group}"
-            
-            # 发送请求，设置超时时间
-            response = requests.get(url, timeout=5)
-            
-            if response.status_code == 200:
-                print(f"已推送 {event_name} 到Bark")
-                sys.stdout.flush()
-            else:
-                print(f"推送到Bark失败: {response.status_code}")
-                sys.stdout.flush()
-        except requests.exceptions.RequestException as e:
-            print(f"网络错误，推送失败: {str(e)}")
-            sys.stdout.flush()
-        except Exception as e:
-            print(f"推送失败: {str(e)}")
-            sys.stdout.flush()
+        url, payload = build_push(bark_key, activity)
+        future = dispatcher.submit(url, activity['event_name'], payload)
+        future.add_done_callback(report_push)
+        futures.append(future)
+    bark.wait_all(futures)
+
+def process_users(users, now_min):
+    """按城市处理一批用户：每个城市只查询一次 now_min（UTC 整数分钟）时刻的活动，再分发给订阅该城市的每个用户
+
+    users 为 {用户ID: User}，返回所有推送的 Future 列表
+    """
+    # 第一步：找出这些用户订阅的城市
+    subscribers = {}
+    for user_id, user in users.items():
+        subscribers.setdefault(user.city, []).append(user_id)
+    
+    futures = []
+    for city in sorted(subscribers):
+        # 第二步：每个城市只查询一次"现在/下一个"
+        user_ids = subscribers[city]
+        print(f"开始处理{city}的 {len(user_ids)} 个用户...")
+        sys.stdout.flush()
+        activities = schedule_index.current_and_next(city, now_min)
+        # 团体之间的空档里活动没有结束，不推送"演出已结束"
+        in_progress = schedule_index.events_in_progress(city, now_min)
+        
+        if activities:
+            # 如果有活动数据，打印到控制台
+            format_output(activities)
+        else:
+            print(f"{city}当前没有正在进行的活动")
+        sys.stdout.flush()
         
-        # 多个推送之间稍作延迟
-        time.sleep(1)
+        # 第三步：把同一份结果分发给每个订阅者
+        for user_id in user_ids:
+            try:
+                # 推送活动变化（包括活动结束）到用户的Bark应用
+                futures += push_activities(user_id, activities, in_progress)
+            except Exception as e:
+                print(f"推送给{users[user_id].username}时出现错误: {str(e)}")
+                sys.stdout.flush()
+    return futures
+
+def wait_pushes(futures):
+    """等待本轮所有推送完成并打印统计"""
+    results = bark.wait_all(futures)
+    if results:
+        ok = sum(1 for result in results if result.ok)
+        print(f"本轮推送完成: 成功 {ok} 条，失败 {len(results) - ok} 条")
+        sys.stdout.flush()
+        monitor_state.record_round(ok, len(results) - ok)
+
+def build_wakeup_heap(cities, now_min, lead_minutes):
+    """把订阅城市即将到来的开始/结束时间放进堆，堆元素为 (唤醒时间, 城市)"""
+    heap = []
+    for city in cities:
+        for boundary in schedule_index.upcoming_boundaries(city, now_min + lead_minutes):
+            heap.append((boundary - lead_minutes, city))
+    heapq.heapify(heap)
+    return heap
+
+def wait_until(deadline):
+    """等待到 deadline，收到退出信号时立即返回 False；接口请求重新加载时提前返回 True"""
+    while running:
+        remaining = (deadline - _now()).total_seconds()
+        if remaining <= 0:
+            return True
+        if os.name == 'nt':
+            remaining = min(remaining, WINDOWS_WAIT_SLICE)
+        if wake_event.wait(remaining):
+            wake_event.clear()
+            return running
+    return False
 
-def main_loop():
-    """主循环，每5分钟运行一次查询"""
+def api_status(query):
+    """GET /status：监控的运行状态"""
+    status = monitor_state.snapshot()
+    status.update(running=running, pid=os.getpid(),
+                  index_date=str(schedule_index.loaded_date) if schedule_index.loaded_date else None,
+                  index_version=schedule_index.version)
+    return status
+
+def api_now(query):
+    """GET /now[?city=城市]：各订阅城市（或指定城市）此刻正在演出的团体和下一个团体"""
+    now = _now()
+    now_min = timetable_db.to_minutes(now)
+    cities = [query['city']] if query.get('city') else monitor_state.snapshot()['cities']
+    return {'time': _format_time(now),
+            'cities': {city: schedule_index.current_and_next(city, now_min) for city in cities}}
+
+def api_next(query):
+    """GET /next：各订阅城市的下一次换场时间，以及换场时开始和结束的团体"""
+    now_min = timetable_db.now_minutes()
+    schedule_index.refresh(now_min)
+    cities = [query['city']] if query.get('city') else monitor_state.snapshot()['cities']
+    result = {}
+    for city in cities:
+        upcoming = schedule_index.upcoming_boundaries(city, now_min)
+        if not upcoming:
+            result[city] = None
+            continue
+        minute = upcoming[0]
+        # 换场时间按城市所在时区显示
+        result[city] = {'time': timetable_db.format_minutes(minute, tz=timetable_db.city_timezone(city)),
+                        'in_minutes': minute - now_min,
+                        'changes': schedule_index.transitions_at(city, minute)}
+    return result
+
+def api_metrics(query):
+    """GET /metrics：Prometheus 文本格式的运行指标（查询耗时、推送耗时和状态码等）"""
+    return monitor_api.TextResponse(metrics.render(), metrics.PROMETHEUS_CONTENT_TYPE)
+
+def api_stats(query):
+    """GET /stats：推送统计"""
+    stats = bark.get_dispatcher().stats_snapshot()
+    snapshot = monitor_state.snapshot()
+    stats.update(rounds=snapshot['rounds'], last_round=snapshot['last_round'])
+    return stats
+
+def api_reload(query):
+    """POST /reload：重新加载时间表和用户配置，并检查所有用户"""
+    reload_event.set()
+    wake_event.set()
+    return {'ok': True}
+
+def api_shutdown(query):
+    """POST /shutdown：安全退出监控"""
+    global running
+    print("\n收到接口退出请求，程序将在当前循环结束后退出...")
+    sys.stdout.flush()
+    running = False
+    wake_event.set()
+    return {'ok': True}
+
+API_ROUTES = {
+    ('GET', '/status'): api_status,
+    ('GET', '/now'): api_now,
+    ('GET', '/next'): api_next,
+    ('GET', '/stats'): api_stats,
+    ('GET', '/metrics'): api_metrics,
+    ('POST', '/reload'): api_reload,
+    ('POST', '/shutdown'): api_shutdown,
+}
+
+def main_loop(lead_minutes=0, api_port=monitor_api.API_PORT):
+    """主循环，在订阅城市的换场时刻（或提前 lead_minutes 分钟）唤醒并推送"""
     # 注册信号处理函数
     register_signals()
     
-    try:
-        # 尝试导入requests库 
-        import requests
-    except ImportError:
+    # 只检查requests库是否已安装，第一次推送时才真正导入
+    if importlib.util.find_spec('requests') is None:
         print("错误: 缺少requests库，请先安装: pip install requests")
         sys.stdout.flush()
         return
     
-    # 加载用户配置
-    with open('user_config.json', 'r', encoding='utf-8') as f:
-        user_config = json.load(f)
-        
-    print(f"活动监控已启动")
+    print(f"活动监控已启动，提前 {lead_minutes} 分钟推送")
     sys.stdout.flush()
+    monitor_state.update(started_at=_now(), lead_minutes=lead_minutes)
     
-    while running:
-        # 获取当前时间
-        now = datetime.now()
-        print(f"\n*** {now.strftime('%Y-%m-%d %H:%M:%S')} 开始检查活动 ***")
+    # 本地HTTP接口，GUI和命令行通过它查询状态，不需要解析日志
+    server = None
+    if api_port:
+        try:
+            server = monitor_api.start_server(API_ROUTES, port=api_port)
+            print(f"状态接口: http://{monitor_api.API_HOST}:{api_port}/status")
+        except OSError as e:
+            print(f"无法启动状态接口（端口 {api_port}）: {str(e)}，可能已有一个活动监控在运行")
         sys.stdout.flush()
+    
+    enabled_users = {}
+    cities = set()
+    users_version = None
+    heap = []
+    heap_version = None
+    while running:
+        now = _now()
+        now_min = timetable_db.to_minutes(now)
         
-        for user_id, user in user_config['users'].items():
-            if not user['enabled']:
-                print(f"用户{user['username']}未启用，跳过")
-                sys.stdout.flush()
-                continue
+        if reload_event.is_set():
+            reload_event.clear()
+            print("\n收到重新加载请求")
+            schedule_index.invalidate()
+            user_store.invalidate()
+        
+        # 启动时和配置文件变化后：重新读取用户，检查所有用户当前的状态
+        # （推送记录会过滤掉没有变化的活动，所以只有新用户或新城市才会收到推送）
+        user_store.refresh()
+        if users_version != user_store.version:
+            enabled_users = {}
+            for user_id, user in user_store.all_users().items():
+                if not user.enabled:
+                    print(f"用户{user.username}未启用，跳过")
+                    continue
+                enabled_users[user_id] = user
+            cities = {user.city for user in enabled_users.values()}
+            users_version = user_store.version
+            heap_version = None
+            print(f"已加载用户配置，订阅城市: {'、'.join(sorted(cities)) or '无'}")
+            monitor_state.update(cities=sorted(cities), user_count=len(enabled_users), last_check=now)
             
-            print(f"开始处理用户{user['username']}...")
+            print(f"\n*** {now.strftime('%Y-%m-%d %H:%M:%S')} 开始检查活动 ***")
             sys.stdout.flush()
-            
-            # 获取当前用户的活动
-            activities = query_activities(user_id)
-            
-            if activities:
-                # 如果有活动数据，打印到控制台
-                format_output(activities)
-                sys.stdout.flush()
-                
-                try:
-                    # 推送活动数据到用户的Bark应用
-                    push_activities(user_id, activities)  
-                    sys.stdout.flush()
-                except Exception as e:
-                    print(f"推送到Bark时出现错误: {str(e)}")
-                    sys.stdout.flush()
+            # 提前推送时，查询的是 lead_minutes 之后的状态；换场时间堆从同一时刻开始，
+            # lead_minutes 之内的换场由这次检查推送
+            wait_pushes(process_users(enabled_users, now_min + lead_minutes))
+        
+        schedule_index.refresh(now_min)
+        
+        # 索引重新加载或订阅城市变化后，重新计算换场时间堆
+        if heap_version != schedule_index.version:
+            heap = build_wakeup_heap(cities, now_min, lead_minutes)
+            heap_version = schedule_index.version
+        
+        # 一直休眠到下一次换场；索引按 UTC 日期加载，没有换场时在日期变化时醒来重新加载。
+        # 不定时检查数据库：生成时间表和保存配置后会通过 POST /reload 唤醒监控
+        deadline = _local_time((now_min // 1440 + 1) * 1440)
+        if heap:
+            next_wakeup = _local_time(heap[0][0])
+            if next_wakeup <= deadline:
+                deadline = next_wakeup
+                print(f"下次检查时间: {deadline.strftime('%Y-%m-%d %H:%M')} ({heap[0][1]}换场)")
             else:
-                print(f"{user['username']}当前没有正在进行的活动")
-                sys.stdout.flush()
+                print(f"近期没有换场，{deadline.strftime('%Y-%m-%d %H:%M')} 重新加载时间表")
+        else:
+            print(f"订阅城市没有即将开始的活动，{deadline.strftime('%Y-%m-%d %H:%M')} 重新加载时间表")
+        sys.stdout.flush()
+        monitor_state.update(next_wakeup=deadline,
+                             next_city=heap[0][1] if heap and deadline == next_wakeup else None)
+        
+        # 等待期间不轮询配置文件，醒来后检查一次（一次 stat），修改过则重新规划
+        if not wait_until(deadline):
+            break
+        user_store.refresh()
+        if users_version != user_store.version:
+            print("\n检测到用户配置变化")
+            continue
         
-        # 等待5分钟，每秒检查一次是否需要退出
-        print(f"下次检查将在5分钟后进行...")
+        # 取出所有已到期的换场
+        now = _now()
+        now_min = timetable_db.to_minutes(now)
+        due_cities = set()
+        while heap and heap[0][0] <= now_min:
+            due_cities.add(heapq.heappop(heap)[1])
+        if not due_cities:
+            continue
+        
+        # 提前推送时，查询的是换场之后的状态
+        target_min = now_min + lead_minutes
+        print(f"\n*** {now.strftime('%Y-%m-%d %H:%M:%S')} {'、'.join(sorted(due_cities))}换场，开始检查活动 ***")
         sys.stdout.flush()
-        for i in range(5 * 60):
-            if not running:
-                break
-            time.sleep(1)
-            # 每分钟输出一个心跳，保持流畅
-            if i > 0 and i % 60 == 0:
-                remaining_minutes = (5*60-i)//60
-                print(f"剩余{remaining_minutes}分钟到下次检查")
-                sys.stdout.flush()
+        due_users = {user_id: user for user_id, user in enabled_users.items() if user.city in due_cities}
+        wait_pushes(process_users(due_users, target_min))
+        monitor_state.update(last_check=now)
     
+    if server is not None:
+        server.shutdown()
     print("程序已安全退出。")
     sys.stdout.flush()
 
-def query_activities(user_id):
-    with open('user_config.json', 'r', encoding='utf-8') as f:
-        user_config = json.load(f)
-    user = user_config['users'][user_id]
+def query_activities(user_id, now_min=None):
+    user = user_store.get(user_id)
     
     # 获取用户所在城市
-    user_city = user['city']
-    print(f"当前用户: {user['username']}, 所在城市: {user_city}")
+    user_city = user.city
+    print(f"当前用户: {user.username}, 所在城市: {user_city}")
     sys.stdout.flush()
     
-    # 获取当前时间
-    now = datetime.now()
-    current_time = now.strftime("%Y-%m-%d %H:%M")
-    
-    # 根据城市获取活动
-    current_activities = get_activities_by_city(user_city, current_time)
+    # 从内存索引中查找正在进行的活动及其下一个团体
+    result = schedule_index.current_and_next(user_city, now_min)
     
     # 如果没有活动，返回信息
-    if not current_activities:
+    if not result:
         print(f"{user_city}当前没有正在进行的活动")
         sys.stdout.flush()
         return None
     
-    # 连接数据库，获取每个活动的下一个团体
-    conn = sqlite3.connect('timetable.db')
-    cursor = conn.cursor()
-    
-    # 获取每个活动的下一个团体
-    result = []
-    for activity in current_activities:
-        # 数据库结构是 (event_name, group_name, start_time, end_time, city, venue)
-        event_name = activity[0]
-        group_name = activity[1]
-        start_time = activity[2]
-        end_time = activity[3]
-        
-        # 获取当前活动的所有团体按时间排序
-        cursor.execute("""
-            SELECT group_name, start_time 
-            FROM activities 
-            WHERE event_name = ?
-            ORDER BY start_time
-        """, (event_name,))
-        
-        all_groups = cursor.fetchall()
-        
-        # 查找当前团体在排序后的列表中的位置
-        current_index = -1
-        for i, (g_name, g_start) in enumerate(all_groups):
-            if g_name == group_name and g_start == start_time:
-                current_index = i
-                break
-        
-        # 获取下一个团体，如果当前是最后一个则返回"无"
-        next_group_name = "无"
-        next_start_time = "无"
-        if current_index != -1 and current_index < len(all_groups) - 1:
-            next_group_name = all_groups[current_index + 1][0]
-            next_start_time = all_groups[current_index + 1][1].split()[1]  # 只取时间部分
-        
-        # 添加到结果列表，但不打印详细信息
-        result.append({
-            'event_name': event_name,
-            'group_name': group_name,
-            'start_time': start_time.split()[1],  # 只取时间部分
-            'end_time': end_time.split()[1],  # 只取时间部分
-            'next_group': next_group_name,
-            'next_start_time': next_start_time
-        })
-    
-    # 关闭数据库连接
-    conn.close()
-    
     return result
 
-def push_activities(user_id, activities):
-    with open('user_config.json', 'r', encoding='utf-8') as f:  
-        user_config = json.load(f)
-    user = user_config['users'][user_id]
+def push_activities(user_id, activities, in_progress=()):
+    """只推送和上次相比发生变化的活动，提交给推送分发器并发发送，返回 Future 列表
+
+    in_progress 为还没有结束的活动名，不在其中且不再有团体演出的活动才推送"演出已结束"
+    """
+    user = user_store.get(user_id)
     
     # 获取用户的Bark推送设置
-    bark_key = user['bark_key']
+    bark_key = user.bark_key
     
-    for activity in activities:
-        try:
-            # 构建推送内容
-            event_name = activity['event_name']
-            group_name = activity['group_name']
-            end_time = activity['end_time']  # 已经只有时间部分了
-            next_group = activity['next_group']
-            next_start_time = activity['next_start_time']
-            
-            # 构建完整URL - 直接在URL中使用中文，Bark会自动处理编码
-            # 标题使用活动名称
-            title = f"{event_name}"
-            
-            # 正文使用当前团体和下一个团体信息
-            body = f"{group_name} ({activity['start_time']}-{end_time})"
-            
-            # 添加下一个团体信息
-            if next_group != "无":
-                body += f"\n下一个: {next_group} ({next_start_time})"
-            
-            # URL编码
-            encoded_title = urllib.parse.quote(title)
-            encoded_body = urllib.parse.quote(body)
-            encoded_group = urllib.parse.quote(event_name)  # 使用活动名作为分组名
-            
-            # 构建URL
-            url = f"https://api.day.app/{bark_key}/{encoded_title}/{encoded_body}?group={encoded_group}"
-            
-            # 打印URL，方便调试
-            print(f"推送URL: {url}")
-            sys.stdout.flush()
-            
-            # 发送请求，设置超时时间
-            response = requests.get(url, timeout=5)
-            
-            if response.status_code == 200:
-                print(f"已推送 {event_name} 到Bark")
-                sys.stdout.flush()
-            else:
-                print(f"推送到Bark失败: {response.status_code}")
-                sys.stdout.flush()
-        except requests.exceptions.RequestException as e:
-            print(f"网络错误，推送失败: {str(e)}")
-            sys.stdout.flush()
-        except Exception as e:
-            print(f"推送失败: {str(e)}")
+    # 和推送记录比较：新团体开始、下一个团体变化或活动结束才推送
+    changed, ended = push_ledger.diff(bark_key, activities, in_progress)
+    if not changed and not ended:
+        if activities:
+            print(f"{user.username}的活动状态没有变化，跳过推送")
             sys.stdout.flush()
+        return []
+    
+    dispatcher = bark.get_dispatcher()
+    
+    def record_when_sent(future, changed, ended):
+        # 只有推送成功才记录，失败的会在下次检查时重新推送
+        result = future.result()
+        if result.ok:
+            push_ledger.record(bark_key, changed, ended)
+    
+    # 合并推送：一个用户每次只发一条通知
+    if user.batch_push and len(changed) + len(ended) > 1:
+        title, body = build_batch_message(user.city, changed, ended)
+        url, payload = bark.build_request(bark_key, title, body, group=user.city)
+        print(f"合并推送 {len(changed)} 个活动变化、{len(ended)} 个活动结束 ({'POST' if payload else 'GET'}, 正文 {bark.body_size(body)} 字节)")
+        sys.stdout.flush()
+        future = dispatcher.submit(url, title, payload)
+        future.add_done_callback(report_push)
+        future.add_done_callback(lambda f: record_when_sent(f, changed, ended))
+        return [future]
+    
+    futures = []
+    for activity in changed:
+        url, payload = build_push(bark_key, activity)
         
-        # 多个推送之间稍作延迟
-        time.sleep(1)
+        # 打印URL，方便调试
+        print(f"推送URL: {url}")
+        sys.stdout.flush()
+        
+        # 由分发器负责连接复用、限速和重试
+        future = dispatcher.submit(url, activity['event_name'], payload)
+        future.add_done_callback(report_push)
+        future.add_done_callback(lambda f, activity=activity: record_when_sent(f, [activity], ()))
+        futures.append(future)
+    
+    for event_name in ended:
+        url, payload = bark.build_request(bark_key, event_name, "演出已结束", group=event_name)
+        future = dispatcher.submit(url, event_name, payload)
+        future.add_done_callback(report_push)
+        future.add_done_callback(lambda f, event_name=event_name: record_when_sent(f, (), [event_name]))
+        futures.append(future)
+    
+    return futures
 
 if __name__ == "__main__":
-    main_loop() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="监控当前正在进行的活动并推送到Bark")
+    parser.add_argument('--lead', type=int, default=0, metavar='MINUTES',
+                        help="在换场前多少分钟推送，默认在换场时推送")
+    parser.add_argument('--api-port', type=int, default=monitor_api.API_PORT, metavar='PORT',
+                        help=f"本地状态接口端口，默认 {monitor_api.API_PORT}，0 表示不启动接口")
+    parser.add_argument('--profile', action='store_true',
+                        help="记录性能分析数据（cProfile 和 tracemalloc），退出时保存到 profiles 目录")
+    args = parser.parse_args()
+    if args.profile:
+        # 只记录主循环线程；退出（Ctrl+C、/shutdown）时写入结果
+        import profiling
+        with profiling.profile_run('monitor', options=vars(args)) as info:
+            main_loop(lead_minutes=args.lead, api_port=args.api_port)
+            info.update(monitor_state.snapshot())
+    else:
+        main_loop(lead_minutes=args.lead, api_port=args.api_port) 
\ No newline at end of file
@@ -0,0 +1,208 @@
+from datetime import datetime, timedelta
+import random
+from copy import copy
+import numpy as np
+from openpyxl import Workbook, load_workbook, __version__ as OPENPYXL_VERSION
+from openpyxl.styles import PatternFill, Alignment, Border, Side
+from openpyxl.utils import get_column_letter
+from openpyxl.cell import WriteOnlyCell
+import timetable_db
+
+# 把解析结果写成Excel工作表；numpy 和 openpyxl 只在这里导入，
+# 只解析文件或只更新数据库时（包括并行解析的子进程）不需要加载它们
+
+# 生成随机颜色
+def random_color():
+    r = random.randint(200, 255)  # 限制颜色较浅，以便黑色文字更易读
+    g = random.randint(200, 255)
+    b = random.randint(200, 255)
+    return f"{r:02x}{g:02x}{b:02x}"
+
+# 创建一个组名到颜色的映射
+group_colors = {}
+
+# 生成时间轴（5分钟间隔）
+def generate_timeline():
+    print("正在生成时间轴...")
+    timeline = []
+    current_time = datetime.strptime("00:00", "%H:%M")
+    end_time = datetime.strptime("23:59", "%H:%M")
+    
+    while current_time <= end_time:
+        timeline.append(current_time.strftime("%H:%M"))
+        current_time += timedelta(minutes=5)
+    
+    print(f"时间轴生成完成，共 {len(timeline)} 个时间点")
+    return timeline
+
+# 时间轴每格5分钟，一天共288格
+SLOT_MINUTES = 5
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+
+# 单元格边框类型：团体块的第一行、中间行、最后一行、只有一行
+BORDER_NONE, BORDER_TOP, BORDER_MIDDLE, BORDER_BOTTOM, BORDER_SINGLE = range(5)
+
+# 所有单元格共用的样式对象
+THIN = Side(style='thin')
+NO_SIDE = Side(style=None)
+CELL_BORDERS = {
+    BORDER_TOP: Border(left=THIN, right=THIN, top=THIN, bottom=NO_SIDE),
+    BORDER_MIDDLE: Border(left=THIN, right=THIN, top=NO_SIDE, bottom=NO_SIDE),
+    BORDER_BOTTOM: Border(left=THIN, right=THIN, top=NO_SIDE, bottom=THIN),
+    BORDER_SINGLE: Border(left=THIN, right=THIN, top=THIN, bottom=THIN),
+}
+CENTER = Alignment(horizontal='center', vertical='center')
+
+# 时间轴第 slot 格的标签；超过一天的部分接着写 24:00、25:05，与通宵活动的习惯写法一致
+def slot_label(slot):
+    minutes = slot * SLOT_MINUTES
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+# 工作表的时间轴：默认一天，有跨午夜的演出时延长到最晚的结束时间
+def sheet_timeline(timeline, rows):
+    return timeline + [slot_label(slot) for slot in range(len(timeline), rows)]
+
+# 一次遍历计算某个日期的 时间格 × 活动 矩阵
+# group_ids[行, 列] 为 0 表示空格，k 表示 group_names[k-1]；borders 记录每格的边框类型
+# 时间按 timetable_db.day_offsets 换算为相对当天 00:00 的分钟数，跨午夜的演出顺延到次日，矩阵随之加长
+def build_sheet_grid(events):
+    columns = [timetable_db.day_offsets(event['schedule']) for event in events]
+    rows = SLOTS_PER_DAY
+    for offsets in columns:
+        for _, start, end in offsets:
+            rows = max(rows, end // SLOT_MINUTES + 1)
+    
+    group_ids = np.zeros((rows, len(events)), dtype=np.int32)
+    borders = np.zeros((rows, len(events)), dtype=np.int8)
+    group_names = []
+    name_ids = {}
+    
+    for col, offsets in enumerate(columns):
+        for group_name, start, end in offsets:
+            # 不在5分钟整点上的时间向前取整
+            start_idx = start // SLOT_MINUTES
+            if end != start:
+                # 确保结束时间的行也被填充（包含结束时间）
+                end_idx = end // SLOT_MINUTES + 1
+            else:
+                # 如果开始时间等于结束时间，将其延长至少5分钟
+                end_idx = start_idx + 1
+            
+            if group_name not in name_ids:
+                group_names.append(group_name)
+                name_ids[group_name] = len(group_names)
+            
+            group_ids[start_idx:end_idx, col] = name_ids[group_name]
+            borders[start_idx:end_idx, col] = BORDER_MIDDLE
+            borders[start_idx, col] = BORDER_TOP
+            borders[end_idx - 1, col] = BORDER_BOTTOM
+            if end_idx - start_idx == 1:
+                borders[start_idx, col] = BORDER_SINGLE
+    
+    return group_ids, borders, group_names
+
+# 为每个团体分配颜色，返回按团体编号排列的填充样式（下标0留空）
+def group_fills(group_names):
+    # 每种团体颜色只创建一个填充样式
+    fills = [None]
+    for group_name in group_names:
+        # 为每个组分配唯一颜色（如果尚未分配）
+        if group_name not in group_colors:
+            group_colors[group_name] = random_color()
+        color = group_colors[group_name]
+        fills.append(PatternFill(start_color=color, end_color=color, fill_type="solid"))
+    return fills
+
+# 复制样式下标使用 openpyxl 的私有属性 cell._style（StyleArray），只在 apply_cell_style 中使用；
+# requirements.txt 把 openpyxl 固定在 3.1.x，其他版本自动改用公开的 fill/border/alignment 设置（慢约3倍）
+STYLE_FAST_PATH = OPENPYXL_VERSION.startswith('3.1.')
+
+# 设置团体单元格的样式；同一种（颜色, 边框）组合只通过公开接口设置一次，
+# 之后的单元格直接复制样式下标，避免每格都对样式对象做哈希
+def apply_cell_style(cell, cell_styles, fills, group_id, border):
+    key = (group_id, border)
+    if STYLE_FAST_PATH and key in cell_styles:
+        cell._style = copy(cell_styles[key])
+        return
+    cell.fill = fills[group_id]
+    cell.border = CELL_BORDERS[border]
+    cell.alignment = CENTER
+    if STYLE_FAST_PATH:
+        cell_styles[key] = copy(cell._style)
+
+# 生成一个日期的工作表：先算好整个矩阵，再把每个单元格只写一次
+def render_date_sheet(wb, date, events, timeline):
+    formatted_date = f"{date[:4]}-{date[4:6]}-{date[6:]}"
+    ws = wb.create_sheet(title=formatted_date)
+    print(f"创建工作表: {formatted_date}")
+    
+    group_ids, borders, group_names = build_sheet_grid(events)
+    fills = group_fills(group_names)
+    
+    # 设置列宽
+    ws.column_dimensions['A'].width = 10
+    
+    # 表头
+    for col_idx, event in enumerate(events, start=2):
+        ws.cell(row=1, column=col_idx, value=event['event_name'])
+        ws.column_dimensions[get_column_letter(col_idx)].width = 20
+    
+    # 按行写入时间轴和团体单元格
+    cell_styles = {}
+    for row, time_str in enumerate(sheet_timeline(timeline, len(group_ids))):
+        ws.cell(row=row+2, column=1, value=time_str)
+        row_ids = group_ids[row].tolist()
+        row_borders = borders[row].tolist()
+        for col, group_id in enumerate(row_ids):
+            if group_id:
+                cell = ws.cell(row=row+2, column=col+2, value=group_names[group_id - 1])
+                apply_cell_style(cell, cell_styles, fills, group_id, row_borders[col])
+    
+    # 冻结第一列和第一行
+    ws.freeze_panes = 'B2'
+    return ws
+
+# 流式生成一个日期的工作表（write_only 工作簿），逐行写出，不在内存中保留单元格
+def stream_date_sheet(wb, date, events, timeline):
+    formatted_date = f"{date[:4]}-{date[4:6]}-{date[6:]}"
+    ws = wb.create_sheet(title=formatted_date)
+    print(f"创建工作表: {formatted_date}")
+    
+    group_ids, borders, group_names = build_sheet_grid(events)
+    fills = group_fills(group_names)
+    
+    # write_only 模式下列宽和冻结窗格必须在写入第一行之前设置
+    ws.column_dimensions['A'].width = 10
+    for col_idx in range(2, len(events) + 2):
+        ws.column_dimensions[get_column_letter(col_idx)].width = 20
+    ws.freeze_panes = 'B2'
+    
+    # 表头
+    ws.append([None] + [event['event_name'] for event in events])
+    
+    # 逐行写出时间轴和团体单元格
+    cell_styles = {}
+    for row, time_str in enumerate(sheet_timeline(timeline, len(group_ids))):
+        row_ids = group_ids[row].tolist()
+        row_borders = borders[row].tolist()
+        values = [time_str]
+        for col, group_id in enumerate(row_ids):
+            if group_id:
+                cell = WriteOnlyCell(ws, value=group_names[group_id - 1])
+                apply_cell_style(cell, cell_styles, fills, group_id, row_borders[col])
+                values.append(cell)
+            else:
+                values.append(None)
+        ws.append(values)
+    return ws
+
+# 创建工作簿；普通模式下删除默认创建的sheet
+def new_workbook(write_only=False):
+    wb = Workbook(write_only=write_only)
+    if not write_only:
+        wb.remove(wb.active)
+    return wb
+
+# 打开已有的工作簿，用于只重新生成部分工作表
+def open_workbook(file_path):
+    return load_workbook(file_path)
@@ -1,354 +1,573 @@
 import os
 import re
-import pandas as pd
-from datetime import datetime, timedelta
-from openpyxl import Workbook
-from openpyxl.styles import PatternFill, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
-import random
-import sqlite3
+import json
+import hashlib
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from typing import NamedTuple
+import metrics
+import timetable_db
 
 # 设置工作目录
 data_dir = "Data"
 output_file = "时间管理表.xlsx"
+db_file = timetable_db.DB_FILE
 
-# 生成随机颜色
-def random_color():
-    r = random.randint(200, 255)  # 限制颜色较浅，以便黑色文字更易读
-    g = random.randint(200, 255)
-    b = random.randint(200, 255)
-    return f"{r:02x}{g:02x}{b:02x}"
+# 文件清单：记录上次生成时每个文件的修改时间、哈希和解析结果，以及当时数据库的指纹；
+# 数据库被删除、替换或没有写完时指纹对不上，执行完整重建
+manifest_file = "timetable_manifest.json"
+# 3: 数据库中跨午夜的演出改为顺延到次日，旧清单需要完整重建一次
+# 4: 解析结果增加时区（出演表开头的 "时区：" 行），旧清单需要重新解析
+MANIFEST_VERSION = 4
 
-# 创建一个组名到颜色的映射
-group_colors = {}
+# 生成指标（Prometheus 文本格式），每次生成结束后写入，可以交给 node_exporter 的 textfile collector 采集；
+# 在GUI中生成时，同一个进程中多次生成的计数会累加
+METRICS_FILE = "generate_metrics.prom"
+STAGE_SECONDS = metrics.histogram('timeing_generate_stage_seconds', "生成时间表各阶段的耗时（秒），total 为整个生成过程",
+                                  ['stage'])
+RUNS = metrics.counter('timeing_generate_runs_total', "生成次数，result 为 done/cancelled/error", ['result'])
+FILES_PARSED = metrics.counter('timeing_generate_files_parsed_total', "解析的出演表文件数")
+ROWS_WRITTEN = metrics.counter('timeing_generate_rows_written_total', "写入数据库的演出数")
 
-# 将字符串时间转换为datetime对象
-def parse_time(time_str):
-    try:
-        return datetime.strptime(time_str, "%H:%M")
-    except ValueError:
-        return None
-
-# 生成时间轴（5分钟间隔）
-def generate_timeline():
-    print("正在生成时间轴...")
-    timeline = []
-    current_time = datetime.strptime("00:00", "%H:%M")
-    end_time = datetime.strptime("23:59", "%H:%M")
-    
-    while current_time <= end_time:
-        timeline.append(current_time.strftime("%H:%M"))
-        current_time += timedelta(minutes=5)
-    
-    print(f"时间轴生成完成，共 {len(timeline)} 个时间点")
-    return timeline
+# 自动模式下，需要解析的文件达到这个数量才使用进程池
+PARALLEL_MIN_FILES = 1000
 
-# 解析文本文件
-def parse_file(file_path):
-    print(f"正在解析文件: {file_path}")
-    with open(file_path, 'r', encoding='utf-8') as f:
-        content = f.read().strip().split('\n')
-    
-    # 去除空行
-    content = [line for line in content if line.strip()]
-    
-    # 提取城市和场地信息（前两行）
-    city = "广州"  # 默认城市
-    venue = "未知场馆"  # 默认场馆
-    
-    if len(content) >= 1 and content[0].startswith("城市"):
-        city_parts = content[0].split("：", 1)
-        if len(city_parts) > 1:
-            city = city_parts[1].strip()
-        content = content[1:]  # 移除城市行
-    
-    if len(content) >= 1 and content[0].startswith("场地"):
-        venue_parts = content[0].split("：", 1)
-        if len(venue_parts) > 1:
-            venue = venue_parts[1].strip()
-        content = content[1:]  # 移除场地行
-    
-    print(f"提取到城市: {city}, 场地: {venue}")
-    
-    # 检查文件格式（移除城市和场地行后）
-    if content and '~' in content[0]:  # 第二种格式（时间范围）
-        print(f"检测到第二种格式（时间范围）")
-        schedule = parse_format2(content)
-    else:  # 第一种格式
-        print(f"检测到第一种格式（开始时间+团体名）")
-        schedule = parse_format1(content)
-    
-    print(f"解析完成，共 {len(schedule)} 个演出团体")
-    return schedule, city, venue
+# 生成进度事件，GUI 等调用方通过 main(progress=...) 接收
+#   stage: 'scan' 扫描文件 / 'parse' 解析 / 'database' 写入数据库 / 'excel' 生成工作表 / 'save' 保存 / 'done' 完成
+#   done/total: 本阶段已完成和总共的数量；elapsed: 本阶段已用秒数
+class ProgressEvent(NamedTuple):
+    stage: str
+    done: int
+    total: int
+    elapsed: float
+    message: str = ""
+
+class GenerationCancelled(Exception):
+    """生成过程被取消；清单没有保存，下次生成会重新处理这些文件"""
+
+# 进度事件最短间隔（秒），避免文件很多时事件过多
+PROGRESS_INTERVAL = 0.1
+
+class Progress:
+    """记录每个阶段的耗时，向调用方发送进度事件，并在阶段之间检查是否被取消"""
+    def __init__(self, callback=None, cancel=None):
+        self.callback = callback
+        self.cancel = cancel
+        self.stage = None
+        self.total = 0
+        self.started = 0.0
+        self.last_sent = 0.0
+        self.timings = {}
+
+    def check_cancel(self):
+        if self.cancel is not None and self.cancel.is_set():
+            raise GenerationCancelled("生成已取消，已写入的数据会在下次生成时重新处理")
+
+    def _send(self, done, message):
+        now = time.perf_counter()
+        self.last_sent = now
+        if self.callback is not None:
+            self.callback(ProgressEvent(self.stage, done, self.total, now - self.started, message))
+
+    def start(self, stage, total=0, message=""):
+        self.check_cancel()
+        self.stage = stage
+        self.total = total
+        self.started = time.perf_counter()
+        self._send(0, message)
+
+    def step(self, done, message=""):
+        """报告本阶段的进度，同时检查是否被取消"""
+        self.check_cancel()
+        if done >= self.total or time.perf_counter() - self.last_sent >= PROGRESS_INTERVAL:
+            self._send(done, message)
+
+    def finish(self, message=""):
+        self.timings[self.stage] = time.perf_counter() - self.started
+        STAGE_SECONDS.observe(self.timings[self.stage], stage=self.stage)
+        self._send(self.total, message)
+
+    def complete(self, started, message=""):
+        """发送 'done' 事件，elapsed 为整个生成过程的用时"""
+        self.stage = 'done'
+        self.total = 1
+        self.started = started
+        self._send(1, message)
+
+
+# 出演表中的行：表头（城市/场地）、时间（第一种格式是时间点，第二种格式是时间范围），其余都是团体名
+HEADER_RE = re.compile(r'(城市|场地|时区)\s*[：:]\s*(.*)')
+TIME_RE = re.compile(r'(\d{1,2})[:：](\d{2})(?:\s*[~～]\s*(\d{1,2})[:：](\d{2}))?')
 
-# 解析第一种格式
-def parse_format1(content):
+DEFAULT_CITY = "广州"  # 默认城市
+DEFAULT_VENUE = "未知场馆"  # 默认场馆
+
+# 一个团体的演出时间，时间统一为 HH:MM
+class ScheduleItem(NamedTuple):
+    group: str
+    start_time: str
+    end_time: str
+
+# 一个出演表文件的解析结果，可以直接解包为 (schedule, city, venue, timezone)
+# timezone 为 None 时使用城市所在的时区
+class Lineup(NamedTuple):
+    schedule: list
+    city: str
+    venue: str
+    timezone: str = None
+
+def _hhmm(hour, minute):
+    return f"{hour}:{minute}" if len(hour) == 2 else f"0{hour}:{minute}"
+
+# 逐行解析出演表，一次遍历同时支持两种格式（也支持两种格式混在同一个文件里）
+#   第一种格式：时间点 + 团体名，团体的结束时间是下一个时间点；
+#     团体名连续出现两次（如特典会）时，第二次的时间是第一次的结束时间
+#   第二种格式：时间范围 + 团体名
+def parse_lines(lines):
+    city = DEFAULT_CITY
+    venue = DEFAULT_VENUE
+    tz_name = None
     schedule = []
-    i = 0
+    counts = [0, 0]       # 两种格式各自的团体数
+    pending = None        # 已读到时间、等待团体名：(开始时间, 结束时间或None)
+    open_group = None     # 第一种格式中还不知道结束时间的团体：(团体名, 开始时间)
+    just_closed = None    # 刚被时间点结束的团体名，用来识别连续出现的同名团体
+    time_match = TIME_RE.fullmatch
+    append = schedule.append
     
-    while i < len(content) - 1:
-        start_time = content[i]
-        group_name = content[i+1]
+    # 文件开头的城市、场地和时区，读到第一行正文为止
+    lines = iter(lines)
+    first_line = None
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        match = HEADER_RE.fullmatch(line)
+        if not match:
+            first_line = line
+            break
+        if match.group(2):
+            if match.group(1) == "城市":
+                city = match.group(2).strip()
+            elif match.group(1) == "场地":
+                venue = match.group(2).strip()
+            else:
+                tz_name = match.group(2).strip()
+    
+    for line in chain((first_line,) if first_line else (), lines):
+        line = line.strip()
+        if not line:
+            continue
         
-        # 检查是否有下一个时间点
-        if i + 2 < len(content) and re.match(r'\d{1,2}:\d{2}', content[i+2]):
-            end_time = content[i+2]
-        else:
-            # 如果没有下一个时间点，使用与开始时间相同的结束时间
-            end_time = start_time
+        # 只有数字开头的行才可能是时间
+        match = time_match(line) if line[0].isdigit() else None
+        if match:
+            start_hour, start_minute, end_hour, end_minute = match.groups()
+            # 时间统一补零为 HH:MM；大多数行本来就是 HH:MM，直接拼接
+            if len(start_hour) == 2:
+                start_time = f"{start_hour}:{start_minute}"
+            else:
+                start_time = _hhmm(start_hour, start_minute)
+            if pending is not None:
+                print(f"警告: 时间 {pending[0]} 后面没有团体名，已忽略")
+            
+            # 任何时间行都是上一个未结束团体的结束时间
+            just_closed = None
+            if open_group is not None:
+                append(ScheduleItem(open_group[0], open_group[1], start_time))
+                just_closed = open_group[0]
+                open_group = None
+            
+            pending = (start_time, _hhmm(end_hour, end_minute) if end_hour else None)
+            continue
         
-        # 处理特典会情况（如果出现两次相同的名称）
-        if i > 0 and group_name == content[i-1]:
-            # 上一个活动和当前活动名称相同，当前时间是结束时间
-            for item in reversed(schedule):
-                if item['group'] == group_name:
-                    item['end_time'] = start_time
-                    break
-        else:
-            schedule.append({
-                'group': group_name,
-                'start_time': start_time,
-                'end_time': end_time
-            })
+        # 团体名
+        if pending is None:
+            print(f"警告: 团体 {line} 前面没有时间，已忽略")
+            continue
+        start_time, end_time = pending
+        pending = None
         
-        i += 2  # 移动到下一对时间和组名
+        if end_time is not None:
+            append(ScheduleItem(line, start_time, end_time))
+            counts[1] += 1
+        elif line == just_closed:
+            # 同名团体连续出现，这个时间已经作为上一个团体的结束时间
+            pass
+        else:
+            open_group = (line, start_time)
+            counts[0] += 1
+        just_closed = None
     
-    # 处理最后一项
-    if len(content) % 2 == 1:
-        last_time = content[-1]
-        for item in reversed(schedule):
-            if item['end_time'] == item['start_time']:  # 找到没有正确结束时间的项
-                item['end_time'] = last_time
-                break
+    if pending is not None and pending[1] is not None:
+        print(f"警告: 时间 {pending[0]}~{pending[1]} 后面没有团体名，已忽略")
+    # 最后一个团体后面没有时间点时，结束时间等于开始时间
+    if open_group is not None:
+        append(ScheduleItem(open_group[0], open_group[1], open_group[1]))
     
-    return schedule
+    return Lineup(schedule, city, venue, tz_name), counts
 
-# 解析第二种格式
-def parse_format2(content):
-    schedule = []
-    i = 0
-    
-    while i < len(content) - 1:
-        time_range = content[i]
-        group_name = content[i+1]
-        
-        # 解析时间范围
-        if '~' in time_range:
-            start_time, end_time = time_range.split('~')
-        else:
-            continue  # 跳过格式不正确的行
-        
-        schedule.append({
-            'group': group_name,
-            'start_time': start_time,
-            'end_time': end_time
-        })
-        
-        i += 2  # 移动到下一对时间范围和组名
+# 解析文本文件
+def parse_file(file_path):
+    print(f"正在解析文件: {file_path}")
+    with open(file_path, 'r', encoding='utf-8') as f:
+        lineup, counts = parse_lines(f)
     
-    return schedule
+    print(f"提取到城市: {lineup.city}, 场地: {lineup.venue}"
+          + (f", 时区: {lineup.timezone}" if lineup.timezone else ""))
+    print(f"解析完成，共 {len(lineup.schedule)} 个演出团体"
+          f"（第一种格式 {counts[0]} 个，第二种格式 {counts[1]} 个）")
+    return lineup
 
-# 主函数
-def main():
-    print("开始生成时间管理表...")
+# 并行解析多个文件，返回与 file_paths 顺序一致的 Lineup 列表
+# jobs 为 0 时自动选择：文件少时串行解析（进程池启动本身也有开销），文件多时使用所有CPU
+# on_parsed(已解析文件数) 在每个文件解析完成后调用，抛出异常时停止解析
+def parse_files(file_paths, jobs=0, on_parsed=None):
+    if jobs <= 0:
+        jobs = 1 if len(file_paths) < PARALLEL_MIN_FILES else (os.cpu_count() or 1)
+    jobs = min(jobs, len(file_paths))
+    results = []
+    if jobs <= 1:
+        for file_path in file_paths:
+            results.append(parse_file(file_path))
+            if on_parsed:
+                on_parsed(len(results))
+        return results
     
-    # 获取所有文件
+    print(f"使用 {jobs} 个进程并行解析 {len(file_paths)} 个文件")
+    chunksize = max(1, len(file_paths) // (jobs * 4))
+    executor = ProcessPoolExecutor(max_workers=jobs)
+    try:
+        # map 按提交顺序返回结果，保证输出顺序确定
+        for result in executor.map(parse_file, file_paths, chunksize=chunksize):
+            results.append(result)
+            if on_parsed:
+                on_parsed(len(results))
+        return results
+    finally:
+        # 中途停止时取消还没开始的任务
+        executor.shutdown(wait=True, cancel_futures=True)
+
+# 计算文件内容的哈希值
+def file_digest(file_path):
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+# 加载上次生成时记录的文件清单；清单记录的数据库指纹和现在的数据库不一致时返回空清单
+def load_manifest():
+    if not os.path.exists(manifest_file):
+        return {}
+    try:
+        with open(manifest_file, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('version') != MANIFEST_VERSION:
+            print("文件清单版本不一致，将执行完整重建")
+            return {}
+        if manifest.get('db') is None or manifest['db'] != timetable_db.file_fingerprint(db_file):
+            print("数据库和文件清单不一致，将执行完整重建")
+            return {}
+        files = manifest.get('files', {})
+        # JSON中保存的是列表，还原为 ScheduleItem
+        for entry in files.values():
+            entry['schedule'] = [ScheduleItem(*item) for item in entry['schedule']]
+        return files
+    except Exception as e:
+        print(f"加载文件清单出错: {str(e)}，将执行完整重建")
+        return {}
+
+# 保存文件清单（先写临时文件再替换，避免中途失败留下半个文件），db_state 为写入后数据库的指纹
+def save_manifest(files, db_state):
+    tmp_file = manifest_file + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump({'version': MANIFEST_VERSION, 'db': db_state, 'files': files}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, manifest_file)
+
+# 扫描Data目录，返回 {文件名: (日期, 活动名)}
+def scan_data_files():
     print(f"扫描目录: {data_dir}")
     all_files = os.listdir(data_dir)
-    text_files = [f for f in all_files if f.endswith('.txt')]
+    text_files = sorted(f for f in all_files if f.endswith('.txt'))
     print(f"找到 {len(text_files)} 个文本文件")
     
-    # 提取所有日期
     date_pattern = r'【(\d{8})】'
-    date_events = {}
-    
+    found = {}
     for file_name in text_files:
         match = re.search(date_pattern, file_name)
         if match:
             date = match.group(1)
             event_name = file_name.replace(f'【{date}】', '').replace('.txt', '')
-            
-            if date not in date_events:
-                date_events[date] = []
-            
-            file_path = os.path.join(data_dir, file_name)
-            schedule, city, venue = parse_file(file_path)
-            
-            date_events[date].append({
-                'event_name': event_name,
-                'schedule': schedule,
-                'city': city,
-                'venue': venue
-            })
+            found[file_name] = (date, event_name)
+    return found
+
+# 对比文件清单，找出新增、修改和删除的文件
+def diff_manifest(found, old_files):
+    changed = []  # 需要重新解析的文件
+    touched = 0   # 修改时间变了但内容没变的文件
+    new_files = {}
     
-    print(f"处理了 {len(date_events)} 个日期的活动")
+    for file_name, (date, event_name) in found.items():
+        file_path = os.path.join(data_dir, file_name)
+        stat = os.stat(file_path)
+        entry = old_files.get(file_name)
+        
+        # 修改时间和大小都没变，直接沿用上次的结果
+        if entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+            new_files[file_name] = entry
+            continue
+        
+        digest = file_digest(file_path)
+        if entry and entry['sha256'] == digest:
+            touched += 1
+            new_files[file_name] = dict(entry, mtime=stat.st_mtime, size=stat.st_size)
+            continue
+        
+        changed.append(file_name)
+        new_files[file_name] = {
+            'mtime': stat.st_mtime,
+            'size': stat.st_size,
+            'sha256': digest,
+            'date': date,
+            'event_name': event_name,
+        }
     
-    # 生成Excel文件
-    print("创建Excel工作簿...")
-    wb = Workbook()
+    removed = [file_name for file_name in old_files if file_name not in found]
+    return new_files, changed, removed, touched
+
+# 把清单中的活动按日期分组
+def group_by_date(files):
+    date_events = {}
+    for file_name in sorted(files):
+        entry = files[file_name]
+        date_events.setdefault(entry['date'], []).append({
+            'event_name': entry['event_name'],
+            'schedule': entry['schedule'],
+            'city': entry['city'],
+            'venue': entry['venue']
+        })
+    return date_events
+
+# 清单条目对应的数据库键 (活动名, YYYY-MM-DD)
+def event_key(entry):
+    date = entry['date']
+    return entry['event_name'], f"{date[:4]}-{date[4:6]}-{date[6:]}"
+
+# 活动所在的时区：出演表指定的时区优先，否则按城市；时区名无效时使用城市的时区
+def event_timezone(entry):
+    city_tz = timetable_db.city_timezone(entry['city'])
+    tz_name = entry.get('timezone') or city_tz
+    try:
+        timetable_db.get_timezone(tz_name)
+    except ValueError:
+        print(f"警告: {entry['event_name']} 的时区 {tz_name} 无效，使用 {city_tz}")
+        tz_name = city_tz
+    return tz_name
+
+# 把清单中的文件整理成批量写入数据库的行：出演表中的当地时间按活动所在时区换算为 UTC 整数分钟，
+# 跨午夜的演出顺延到次日
+def build_event_rows(files, file_names):
+    events = []
+    for file_name in file_names:
+        entry = files[file_name]
+        event_name, event_date = event_key(entry)
+        tz_name = event_timezone(entry)
+        tz = timetable_db.get_timezone(tz_name)
+        day_start = timetable_db.wall_minutes(f"{event_date} 00:00")
+        acts = [(group, timetable_db.wall_to_utc(day_start + start, tz), timetable_db.wall_to_utc(day_start + end, tz))
+                for group, start, end in timetable_db.day_offsets(entry['schedule'])]
+        events.append((event_name, event_date, entry['city'], entry['venue'], tz_name, acts))
+    return events
+
+# 主函数
+# progress(ProgressEvent) 接收进度事件；cancel 是 threading.Event，设置后在下一个检查点抛出 GenerationCancelled。
+# 清单最后保存，中途取消时下次生成会重新处理这些文件；返回本次生成的统计信息
+def main(full_rebuild=False, stream=False, jobs=0, progress=None, cancel=None):
+    try:
+        summary = _generate(full_rebuild, stream, jobs, progress, cancel)
+    except GenerationCancelled:
+        RUNS.inc(result='cancelled')
+        raise
+    except Exception:
+        RUNS.inc(result='error')
+        raise
+    else:
+        RUNS.inc(result='done')
+        FILES_PARSED.inc(summary['parsed'])
+        ROWS_WRITTEN.inc(summary['rows'])
+        # 活动监控不定时检查数据库，时间表有变化时通知它重新加载
+        if summary['parsed'] or summary['removed']:
+            import monitor_api
+            monitor_api.request_reload(wait=True)
+        return summary
+    finally:
+        metrics.write_file(METRICS_FILE)
+
+def _generate(full_rebuild, stream, jobs, progress, cancel):
+    print("开始生成时间管理表...")
+    tracker = Progress(progress, cancel)
+    started = time.perf_counter()
+    
+    tracker.start('scan', message="扫描数据文件")
+    found = scan_data_files()
     
-    # 删除默认创建的sheet
-    default_sheet = wb.active
-    wb.remove(default_sheet)
+    # Excel或数据库丢失时，清单已经失效
+    if full_rebuild or not os.path.exists(output_file) or not os.path.exists(db_file):
+        old_files = {}
+    else:
+        old_files = load_manifest()
+    if not old_files:
+        print("执行完整重建")
     
-    # 为每个日期创建一个sheet
-    timeline = generate_timeline()
+    files, changed, removed, touched = diff_manifest(found, old_files)
+    tracker.finish(f"找到 {len(found)} 个文件，{len(changed)} 个需要解析")
     
-    # 设置数据库文件路径
-    db_file = 'timetable.db'
+    # 只重新解析新增和修改过的文件
+    tracker.start('parse', len(changed), "解析出演表")
+    file_paths = [os.path.join(data_dir, file_name) for file_name in changed]
+    parsed = parse_files(file_paths, jobs, on_parsed=tracker.step)
+    for file_name, (schedule, city, venue, tz_name) in zip(changed, parsed):
+        files[file_name].update(schedule=schedule, city=city, venue=venue, timezone=tz_name)
     
-    # 创建/连接数据库
+    skipped = len(found) - len(changed)
+    print(f"解析 {len(changed)} 个文件，跳过 {skipped} 个未变化的文件"
+          f"（其中 {touched} 个仅修改时间变化），删除 {len(removed)} 个文件")
+    tracker.finish(f"解析 {len(changed)} 个文件，跳过 {skipped} 个")
+    
+    date_events = group_by_date(files)
+    print(f"处理了 {len(date_events)} 个日期的活动")
+    
+    # 受影响的日期：变化文件所在的日期，以及被删除文件原来所在的日期
+    dirty_dates = {files[f]['date'] for f in changed} | {old_files[f]['date'] for f in removed}
+    
+    # 创建/连接数据库（旧版数据库会在这里自动迁移）
+    tracker.start('database', message="写入数据库")
     print(f"连接数据库: {db_file}")
-    with sqlite3.connect(db_file) as conn:
-        c = conn.cursor()
-        print("创建数据库表 activities (如果不存在)")
-        c.execute('''CREATE TABLE IF NOT EXISTS activities
-                     (event_name TEXT, group_name TEXT, 
-                     start_time DATETIME, end_time DATETIME, city TEXT, venue TEXT)''')
-        
-        # 更新数据库逻辑
+    conn = timetable_db.connect_writer(db_file)
+    try:
         print("开始向数据库写入活动数据...")
-        activity_count = 0
-        
-        for date, events in sorted(date_events.items()):
-            formatted_date = f"{date[:4]}-{date[4:6]}-{date[6:]}"
-            print(f"处理日期: {formatted_date}")
-            
-            for event in events:
-                # 先删除已存在的同名活动数据
-                c.execute('DELETE FROM activities WHERE event_name = ?', 
-                         (event['event_name'],))
-                
-                # 插入新数据
-                for item in event['schedule']:
-                    start_datetime = f"{formatted_date} {item['start_time']}"
-                    end_datetime = f"{formatted_date} {item['end_time']}"
-                    c.execute('''INSERT INTO activities VALUES
-                                 (?, ?, ?, ?, ?, ?)''',
-                             (event['event_name'], item['group'],
-                              start_datetime, end_datetime, 
-                              event['city'], event['venue']))
-                    activity_count += 1
-        
+        events = build_event_rows(files, changed)
+        if not old_files:
+            # 完整重建：写入临时表后整体替换，监控等读取方不会看到写了一半的表
+            activity_count = timetable_db.load_all(conn, events)
+        else:
+            # 增量更新：只删除和写入变化文件对应的记录
+            removed_keys = [event_key(old_files.get(f) or files[f]) for f in removed + changed]
+            activity_count = timetable_db.replace_events(conn, removed_keys, events)
         print(f"成功写入 {activity_count} 条活动记录到数据库")
-        
-    # 原有的Excel生成逻辑
+        db_state = timetable_db.fingerprint(conn)
+    finally:
+        conn.close()
+    tracker.total = activity_count
+    tracker.finish(f"写入 {activity_count} 条活动记录")
+    
+    summary = {
+        'files': len(found),
+        'parsed': len(changed),
+        'removed': len(removed),
+        'rows': activity_count,
+        'dates': len(date_events),
+        'sheets': 0,
+        'sheets_removed': 0,
+        'timings': tracker.timings,
+    }
+    
+    # Excel生成逻辑：只重新生成受影响的日期工作表
+    if not old_files:
+        dirty_dates = set(date_events)
+    
+    if old_files and not dirty_dates:
+        print(f"没有文件变化，跳过全部 {len(date_events)} 个工作表")
+        save_manifest(files, db_state)
+        print("所有操作已完成!")
+        return _finish(tracker, summary, started)
+    
+    # Excel相关的模块（numpy、openpyxl）只在需要生成工作表时才导入
+    import excel_render
     print("开始生成Excel表格...")
-    for date, events in sorted(date_events.items()):
-        # 添加一个新的sheet
-        formatted_date = f"{date[:4]}-{date[4:6]}-{date[6:]}"
-        ws = wb.create_sheet(title=formatted_date)
-        print(f"创建工作表: {formatted_date}")
+    timeline = excel_render.generate_timeline()
+    
+    # 流式模式：write_only 工作簿无法修改已有文件，所以重写所有日期的工作表，
+    # 但未变化的文件仍然直接使用清单中的解析结果；内存占用与日期数量无关
+    if stream:
+        print("使用流式写入模式创建Excel工作簿...")
+        wb = excel_render.new_workbook(write_only=True)
+        tracker.start('excel', len(date_events), "生成工作表")
+        for index, date in enumerate(sorted(date_events), 1):
+            excel_render.stream_date_sheet(wb, date, date_events[date], timeline)
+            tracker.step(index, date)
+        print(f"流式写入 {len(date_events)} 个工作表")
+        summary['sheets'] = len(date_events)
+        tracker.finish(f"生成 {len(date_events)} 个工作表")
+    else:
+        if old_files:
+            print(f"加载已有Excel文件: {output_file}")
+            wb = excel_render.open_workbook(output_file)
+        else:
+            print("创建Excel工作簿...")
+            wb = excel_render.new_workbook()
         
-        # 设置列宽
-        ws.column_dimensions['A'].width = 10
+        # 源文件全部被删除的日期只删除工作表，不重新生成
+        regenerated = removed_sheets = 0
+        tracker.start('excel', len(dirty_dates), "生成工作表")
+        for index, date in enumerate(sorted(dirty_dates), 1):
+            formatted_date = f"{date[:4]}-{date[4:6]}-{date[6:]}"
+            if formatted_date in wb.sheetnames:
+                wb.remove(wb[formatted_date])
+                if date not in date_events:
+                    removed_sheets += 1
+            if date in date_events:
+                excel_render.render_date_sheet(wb, date, date_events[date], timeline)
+                regenerated += 1
+            tracker.step(index, date)
         
-        # 填充时间轴
-        for i, time_str in enumerate(timeline):
-            ws.cell(row=i+2, column=1, value=time_str)
+        # 工作表按日期排序
+        for index, title in enumerate(sorted(wb.sheetnames)):
+            ws = wb[title]
+            wb.move_sheet(ws, offset=index - wb.index(ws))
         
-        # 填充事件
-        for col_idx, event in enumerate(events, start=2):
-            event_name = event['event_name']
-            ws.cell(row=1, column=col_idx, value=event_name)
-            ws.column_dimensions[get_column_letter(col_idx)].width = 20
-            
-            for item in event['schedule']:
-                group_name = item['group']
-                
-                # 为每个组分配唯一颜色（如果尚未分配）
-                if group_name not in group_colors:
-                    group_colors[group_name] = random_color()
-                
-                fill = PatternFill(start_color=group_colors[group_name], end_color=group_colors[group_name], fill_type="solid")
-                
-                # 找到开始和结束时间在时间轴中的索引
-                try:
-                    start_idx = timeline.index(item['start_time'])
-                    
-                    # 对于第二种格式，结束时间直接取结束时间
-                    # 对于第一种格式，结束时间是下一个开始时间
-                    if item['end_time'] != item['start_time']:
-                        end_idx = timeline.index(item['end_time'])
-                        # 修复：确保结束时间的行也被填充（包含结束时间）
-                        end_idx += 1
-                    else:
-                        # 如果开始时间等于结束时间，将其延长至少5分钟
-                        end_idx = start_idx + 1
-                        
-                    # 特殊情况：如果结束时间比开始时间早，可能是跨越午夜
-                    if end_idx <= start_idx:
-                        end_idx = len(timeline) - 1  # 延长到当天最后一个时间点
-                    
-                    # 设置每个单元格的值和填充色
-                    for row_idx in range(start_idx, end_idx):
-                        cell = ws.cell(row=row_idx+2, column=col_idx, value=group_name)
-                        cell.fill = fill
-                        cell.alignment = Alignment(horizontal='center', vertical='center')
-                        
-                        # 设置一个无边框的默认样式
-                        no_border = Border(
-                            left=Side(style=None),
-                            right=Side(style=None),
-                            top=Side(style=None),
-                            bottom=Side(style=None)
-                        )
-                        cell.border = no_border
-                    
-                    # 只在团体块的外围设置边框
-                    # 上边框
-                    top_cell = ws.cell(row=start_idx+2, column=col_idx)
-                    top_cell.border = Border(
-                        left=Side(style='thin'),
-                        right=Side(style='thin'),
-                        top=Side(style='thin'),
-                        bottom=Side(style=None)
-                    )
-                    
-                    # 下边框 - 修复：使用正确的行索引
-                    bottom_cell = ws.cell(row=start_idx+2+(end_idx-start_idx-1), column=col_idx)
-                    bottom_cell.border = Border(
-                        left=Side(style='thin'),
-                        right=Side(style='thin'),
-                        top=Side(style=None),
-                        bottom=Side(style='thin')
-                    )
-                    
-                    # 中间行的左右边框
-                    for row_idx in range(start_idx+1, end_idx-1):
-                        middle_cell = ws.cell(row=row_idx+2, column=col_idx)
-                        middle_cell.border = Border(
-                            left=Side(style='thin'),
-                            right=Side(style='thin'),
-                            top=Side(style=None),
-                            bottom=Side(style=None)
-                        )
-                    
-                    # 如果只有一行，同时设置上下左右边框
-                    if start_idx == end_idx - 1:
-                        single_cell = ws.cell(row=start_idx+2, column=col_idx)
-                        single_cell.border = Border(
-                            left=Side(style='thin'),
-                            right=Side(style='thin'),
-                            top=Side(style='thin'),
-                            bottom=Side(style='thin')
-                        )
-                        
-                except ValueError:
-                    # 如果时间不在时间轴中，跳过
-                    print(f"警告: 时间 {item['start_time']} 或 {item['end_time']} 不在时间轴中")
+        print(f"重新生成 {regenerated} 个工作表，删除 {removed_sheets} 个工作表，"
+              f"跳过 {len(date_events) - regenerated} 个未变化的工作表")
+        summary['sheets'] = regenerated
+        summary['sheets_removed'] = removed_sheets
+        tracker.finish(f"重新生成 {regenerated} 个工作表，删除 {removed_sheets} 个")
     
-    # 冻结第一列和第一行
-    for sheet in wb.sheetnames:
-        ws = wb[sheet]
-        ws.freeze_panes = 'B2'
-    
-    # 保存Excel文件
+    # 保存Excel文件；开始保存后不再响应取消，避免留下写了一半的文件
+    tracker.start('save', message="保存Excel文件")
     print(f"保存Excel文件: {output_file}")
     wb.save(output_file)
+    
+    save_manifest(files, db_state)
+    tracker.finish(f"已保存 {output_file}")
     print(f"Excel文件已生成: {output_file}")
     print(f"数据库文件已生成: {db_file}")
     print("所有操作已完成!")
+    return _finish(tracker, summary, started)
+
+def _finish(tracker, summary, started):
+    summary['elapsed'] = time.perf_counter() - started
+    STAGE_SECONDS.observe(summary['elapsed'], stage='total')
+    tracker.complete(started, f"完成，用时 {summary['elapsed']:.1f} 秒")
+    return summary
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="根据Data目录生成时间管理表")
+    parser.add_argument('--full', action='store_true', help="忽略文件清单，完整重建")
+    parser.add_argument('--stream', action='store_true',
+                        help="使用流式写入模式生成Excel，适合日期很多的大型时间表")
+    parser.add_argument('--jobs', type=int, default=0, metavar='N',
+                        help="解析文件使用的进程数，默认根据文件数量自动选择，1 表示串行解析")
+    parser.add_argument('--profile', action='store_true',
+                        help="记录性能分析数据（cProfile 和 tracemalloc），结果保存在 profiles 目录")
+    args = parser.parse_args()
+    options = {'full_rebuild': args.full, 'stream': args.stream, 'jobs': args.jobs}
+    if args.profile:
+        # 只有需要时才导入性能分析模块
+        import profiling
+        with profiling.profile_run('generate', data_dir, options=options) as info:
+            info['summary'] = main(**options)
+    else:
+        main(**options)
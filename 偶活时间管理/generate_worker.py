@@ -0,0 +1,122 @@
+import sys
+import queue
+import importlib
+import threading
+import traceback
+import contextlib
+
+# 在界面进程内生成时间管理表的后台线程
+# 生成过程通过 on_event(类型, 数据) 通知调用方，回调在工作线程中执行，界面需要自己切回主线程：
+#   'ready'     None                                   生成模块已加载
+#   'progress'  generate_timetable.ProgressEvent       阶段进度
+#   'log'       str                                    生成过程输出的一行文字
+#   'done'      dict                                   main() 返回的统计信息
+#   'cancelled' str                                    已取消
+#   'error'     str                                    出错信息（含调用栈）
+
+class _ThreadOutput:
+    """替换 sys.stdout：只把指定线程的输出按行交给回调，其他线程照常输出"""
+    def __init__(self, stream, thread, callback):
+        self.stream = stream
+        self.thread = thread
+        self.callback = callback
+        self.buffer = ""
+
+    def write(self, text):
+        if threading.current_thread() is not self.thread:
+            return self.stream.write(text) if self.stream else len(text)
+        self.buffer += text
+        *lines, self.buffer = self.buffer.split("\n")
+        for line in lines:
+            if line.strip():
+                self.callback(line.strip())
+        return len(text)
+
+    def flush(self):
+        if self.stream:
+            self.stream.flush()
+
+class GenerateWorker:
+    """常驻的生成线程：启动时预先导入 generate_timetable 和 excel_render（numpy/openpyxl 导入较慢），
+    之后每次生成都在同一个进程中运行，不用再启动新的 Python 进程"""
+    def __init__(self, on_event):
+        self.on_event = on_event
+        self.jobs = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.busy = threading.Event()
+        self.module = None
+        self.thread = threading.Thread(target=self._run, name="generate-worker", daemon=True)
+        self.thread.start()
+
+    def submit(self, **options):
+        """提交一次生成，参数同 generate_timetable.main()，另外 profile=True 时记录性能分析数据；
+        正在生成时返回 False"""
+        if self.busy.is_set():
+            return False
+        self.busy.set()
+        self.cancel_event.clear()
+        self.jobs.put(options)
+        return True
+
+    def cancel(self):
+        """请求取消正在进行的生成，在下一个检查点生效"""
+        if self.busy.is_set():
+            self.cancel_event.set()
+
+    def is_busy(self):
+        return self.busy.is_set()
+
+    def _emit(self, kind, data=None):
+        try:
+            self.on_event(kind, data)
+        except Exception:
+            traceback.print_exc()
+
+    def _run(self):
+        try:
+            import generate_timetable
+            # 预先加载Excel模块，第一次生成时不用再等待导入
+            importlib.import_module('excel_render')
+            self.module = generate_timetable
+            self._emit('ready')
+        except Exception:
+            self._emit('error', f"加载生成模块失败:\n{traceback.format_exc()}")
+            return
+
+        while True:
+            options = self.jobs.get()
+            if options is None:
+                break
+            self._generate(options)
+
+    def _generate(self, options):
+        output = _ThreadOutput(sys.stdout, self.thread, lambda line: self._emit('log', line))
+        original = sys.stdout
+        sys.stdout = output
+        try:
+            with self._profile(options) as info:
+                summary = self.module.main(progress=lambda event: self._emit('progress', event),
+                                           cancel=self.cancel_event, **options)
+                info['summary'] = summary
+        except self.module.GenerationCancelled as e:
+            self._emit('cancelled', str(e))
+        except Exception:
+            self._emit('error', traceback.format_exc())
+        else:
+            self._emit('done', summary)
+        finally:
+            if sys.stdout is output:
+                sys.stdout = original
+            self.busy.clear()
+
+    def _profile(self, options):
+        """profile=True 时在生成线程中记录性能分析数据，否则什么也不做"""
+        if not options.pop('profile', False):
+            return contextlib.nullcontext({})
+        import profiling
+        return profiling.profile_run('generate', self.module.data_dir, options=dict(options))
+
+    def stop(self):
+        """取消正在进行的生成并结束工作线程"""
+        self.cancel()
+        self.jobs.put(None)
@@ -0,0 +1,157 @@
+import queue
+import logging
+import time
+import tkinter as tk
+from collections import deque
+from logging.handlers import RotatingFileHandler
+from tkinter import ttk
+
+# 界面日志：任何线程都可以调用 LogView.log()，消息先放进队列，
+# 由界面线程定时批量取出显示，界面只保留最近 MAX_LINES 行，完整日志写入滚动的日志文件
+LOG_FILE = 'timeing_manager.log'
+LOG_FILE_MAX_BYTES = 1024 * 1024
+LOG_FILE_BACKUPS = 3
+
+FLUSH_MS = 200        # 界面取出日志的间隔（毫秒）
+BATCH_MAX = 500       # 每次最多取出的日志数，其余留到下一次
+MAX_LINES = 2000      # 界面最多保留的日志行数
+
+# 级别筛选选项：显示名 -> 最低级别
+LEVEL_FILTERS = {
+    "全部": logging.DEBUG,
+    "信息": logging.INFO,
+    "警告": logging.WARNING,
+    "错误": logging.ERROR,
+}
+LEVEL_NAMES = {logging.DEBUG: "调试", logging.INFO: "信息", logging.WARNING: "警告", logging.ERROR: "错误"}
+
+def file_logger(log_file=LOG_FILE):
+    """返回写入滚动日志文件的 logger，文件超过 LOG_FILE_MAX_BYTES 时轮换"""
+    logger = logging.getLogger('timeing_manager')
+    if not logger.handlers:
+        try:
+            handler = RotatingFileHandler(log_file, maxBytes=LOG_FILE_MAX_BYTES,
+                                          backupCount=LOG_FILE_BACKUPS, encoding='utf-8')
+        except OSError as e:
+            print(f"无法打开日志文件 {log_file}: {str(e)}")
+            handler = logging.NullHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.DEBUG)
+        logger.propagate = False
+    return logger
+
+class LogView:
+    """带级别筛选的日志区域，显示的行数有上限，添加日志不会阻塞调用方"""
+    def __init__(self, root, parent, log_file=LOG_FILE):
+        self.root = root
+        self.queue = queue.SimpleQueue()
+        self.lines = deque(maxlen=MAX_LINES)  # 最近的 (级别, 文字)，切换筛选时重新显示
+        self.logger = file_logger(log_file) if log_file else None
+        self.min_level = logging.DEBUG
+
+        # 级别筛选
+        filter_frame = ttk.Frame(parent)
+        filter_frame.pack(fill='x', padx=5, pady=(5, 0))
+        ttk.Label(filter_frame, text="显示级别:").pack(side=tk.LEFT)
+        self.level_var = tk.StringVar(value="全部")
+        level_box = ttk.Combobox(filter_frame, textvariable=self.level_var, values=list(LEVEL_FILTERS),
+                                 state='readonly', width=8)
+        level_box.pack(side=tk.LEFT, padx=5)
+        level_box.bind('<<ComboboxSelected>>', lambda event: self.set_level(self.level_var.get()))
+
+        # 添加包含滚动条的框架
+        text_frame = ttk.Frame(parent)
+        text_frame.pack(fill='both', expand=True, padx=5, pady=5)
+
+        # 垂直滚动条
+        scrollbar_y = ttk.Scrollbar(text_frame)
+        scrollbar_y.pack(side=tk.RIGHT, fill=tk.Y)
+
+        # 水平滚动条
+        scrollbar_x = ttk.Scrollbar(text_frame, orient='horizontal')
+        scrollbar_x.pack(side=tk.BOTTOM, fill=tk.X)
+
+        # 创建文本框
+        self.text = tk.Text(text_frame, wrap=tk.NONE, height=15, width=80, state=tk.DISABLED,
+                            yscrollcommand=scrollbar_y.set,
+                            xscrollcommand=scrollbar_x.set)
+        self.text.pack(fill='both', expand=True)
+        self.text.tag_config('warning', foreground='#b36b00')
+        self.text.tag_config('error', foreground='#c00000')
+
+        # 设置滚动条与文本框的关联
+        scrollbar_y.config(command=self.text.yview)
+        scrollbar_x.config(command=self.text.xview)
+
+        self.root.after(FLUSH_MS, self._poll)
+
+    def log(self, message, level=logging.INFO):
+        """添加一条日志，可以在任何线程中调用"""
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+        self.queue.put((level, f"[{timestamp}] {message}"))
+
+    def _poll(self):
+        try:
+            self.flush()
+        finally:
+            self.root.after(FLUSH_MS, self._poll)
+
+    def flush(self):
+        """取出队列中的日志，写入日志文件并一次性显示"""
+        batch = []
+        try:
+            while len(batch) < BATCH_MAX:
+                batch.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        if not batch:
+            return
+
+        if self.logger:
+            # 整批写一次文件，比逐行调用 logger 快得多
+            self.logger.info("\n".join(f"{LEVEL_NAMES.get(level, '信息')} {line}" for level, line in batch))
+        self.lines.extend(batch)
+        self._append([(level, line) for level, line in batch if level >= self.min_level])
+
+    def _append(self, entries):
+        if not entries:
+            return
+        # 只有在已经滚动到底部时才自动滚动，方便翻看之前的日志
+        at_bottom = self.text.yview()[1] >= 0.999
+        # Text.insert 可以一次插入多段 (文字, 标签)，整批只调用一次
+        chunks = []
+        for level, line in entries:
+            chunks.extend((line + "\n", self._tag(level)))
+        self.text.config(state=tk.NORMAL)
+        self.text.insert(tk.END, *chunks)
+        # 超出上限时删除最早的行
+        line_count = int(self.text.index('end-1c').split('.')[0]) - 1
+        if line_count > MAX_LINES:
+            self.text.delete('1.0', f'{line_count - MAX_LINES + 1}.0')
+        self.text.config(state=tk.DISABLED)
+        if at_bottom:
+            self.text.see(tk.END)
+
+    @staticmethod
+    def _tag(level):
+        if level >= logging.ERROR:
+            return 'error'
+        if level >= logging.WARNING:
+            return 'warning'
+        return ()
+
+    def set_level(self, name):
+        """切换显示的最低级别，用保留的最近日志重新显示"""
+        self.min_level = LEVEL_FILTERS.get(name, logging.DEBUG)
+        self.text.config(state=tk.NORMAL)
+        self.text.delete('1.0', tk.END)
+        self.text.config(state=tk.DISABLED)
+        self._append([(level, line) for level, line in self.lines if level >= self.min_level])
+
+    def clear(self):
+        """清空界面上的日志（日志文件不受影响）"""
+        self.lines.clear()
+        self.text.config(state=tk.NORMAL)
+        self.text.delete('1.0', tk.END)
+        self.text.config(state=tk.DISABLED)
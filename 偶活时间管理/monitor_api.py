@@ -0,0 +1,137 @@
+import sys
+import json
+import argparse
+import threading
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 活动监控的本地HTTP接口，只监听本机
+API_HOST = '127.0.0.1'
+API_PORT = 8765
+REQUEST_TIMEOUT = 2
+# 修改状态的 POST 请求必须带上这个请求头：网页不能跨域发送自定义请求头（需要预检，而接口不响应预检），
+# 本机打开的网页因此无法让监控退出或重新加载
+CLIENT_HEADER = 'X-Monitor-Client'
+
+class ApiError(Exception):
+    """接口返回的错误，status 为HTTP状态码"""
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class TextResponse:
+    """接口函数返回它时按原样输出文本而不是JSON，例如 Prometheus 指标"""
+    def __init__(self, text, content_type='text/plain; charset=utf-8'):
+        self.text = text
+        self.content_type = content_type
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """把请求分发给 server.routes 中注册的函数，函数接收查询参数字典，返回可以转成JSON的对象或 TextResponse"""
+
+    def _dispatch(self, method):
+        url = urllib.parse.urlsplit(self.path)
+        query = {key: values[-1] for key, values in urllib.parse.parse_qs(url.query).items()}
+        handler = self.server.routes.get((method, url.path.rstrip('/') or '/'))
+        try:
+            if method == 'POST' and (CLIENT_HEADER not in self.headers or 'Origin' in self.headers):
+                raise ApiError(403, "拒绝来自网页的请求")
+            if handler is None:
+                raise ApiError(404, f"未知接口: {method} {url.path}")
+            status, result = 200, handler(query)
+        except ApiError as e:
+            status, result = e.status, {'error': str(e)}
+        except Exception as e:
+            status, result = 500, {'error': str(e)}
+
+        if isinstance(result, TextResponse):
+            body, content_type = result.text.encode('utf-8'), result.content_type
+        else:
+            body, content_type = json.dumps(result, ensure_ascii=False).encode('utf-8'), 'application/json; charset=utf-8'
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def log_message(self, format, *args):
+        # 不把每个请求都打印到监控日志里
+        pass
+
+def start_server(routes, host=API_HOST, port=API_PORT):
+    """在后台线程中启动接口服务，routes 为 {(方法, 路径): 函数}，返回服务器对象"""
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    server.daemon_threads = True
+    server.routes = routes
+    threading.Thread(target=server.serve_forever, name="monitor-api", daemon=True).start()
+    return server
+
+def call(path, method='GET', host=API_HOST, port=API_PORT, timeout=REQUEST_TIMEOUT, **params):
+    """调用监控接口，返回解析后的JSON（不是JSON的接口返回文本）；监控未运行时抛出 OSError，接口报错时抛出 ApiError"""
+    # 客户端才需要 urllib.request，监控启动时不导入
+    import urllib.request
+    import urllib.error
+    url = f"http://{host}:{port}{path}"
+    if params:
+        url += "?" + urllib.parse.urlencode(params)
+    request = urllib.request.Request(url, method=method, data=b'' if method == 'POST' else None,
+                                     headers={CLIENT_HEADER: '1'})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            text = response.read().decode('utf-8')
+            if response.headers.get_content_type() != 'application/json':
+                return text
+            return json.loads(text)
+    except urllib.error.HTTPError as e:
+        try:
+            message = json.loads(e.read().decode('utf-8')).get('error', str(e))
+        except ValueError:
+            message = str(e)
+        raise ApiError(e.code, message) from None
+
+def request_reload(host=API_HOST, port=API_PORT, wait=False):
+    """通知正在运行的活动监控重新加载用户配置和时间表，监控没有运行时忽略
+
+    默认在后台线程中发送，不阻塞界面；wait=True 时发送完才返回，供马上就会退出的命令行程序使用
+    """
+    def send():
+        try:
+            call('/reload', method='POST', host=host, port=port)
+        except (OSError, ApiError):
+            pass
+    if wait:
+        send()
+    else:
+        threading.Thread(target=send, name="monitor-reload", daemon=True).start()
+
+def is_running(host=API_HOST, port=API_PORT):
+    """活动监控是否正在运行"""
+    try:
+        call('/status', host=host, port=port, timeout=0.5)
+        return True
+    except (OSError, ApiError):
+        return False
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="查询正在运行的活动监控")
+    parser.add_argument('command', choices=['status', 'now', 'next', 'stats', 'metrics', 'reload', 'shutdown'])
+    parser.add_argument('city', nargs='?', help="now 命令只查询这个城市")
+    parser.add_argument('--port', type=int, default=API_PORT)
+    args = parser.parse_args()
+
+    method = 'POST' if args.command in ('reload', 'shutdown') else 'GET'
+    params = {'city': args.city} if args.city else {}
+    try:
+        result = call('/' + args.command, method=method, port=args.port, **params)
+    except ApiError as e:
+        print(f"接口返回错误 {e.status}: {e}")
+        sys.exit(1)
+    except OSError as e:
+        print(f"无法连接活动监控（端口 {args.port}）: {e}")
+        sys.exit(1)
+    print(result if isinstance(result, str) else json.dumps(result, ensure_ascii=False, indent=2))
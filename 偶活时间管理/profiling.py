@@ -0,0 +1,187 @@
+import os
+import re
+import sys
+import json
+import time
+import pstats
+import cProfile
+import argparse
+import platform
+import tracemalloc
+from contextlib import contextmanager
+
+# 性能分析：--profile 时用 cProfile 记录函数耗时，用 tracemalloc 比较开始和结束时的内存分配。
+# 每次运行在 PROFILE_DIR 中写入一组文件，文件名前缀为 <名称>-<时间>-<Data文件数>files：
+#   .pstats       cProfile 原始数据，可以用 pstats、snakeviz 等工具打开，也可以和基准比较
+#   -profile.txt  按累计耗时和自身耗时排序的前 PROFILE_TOP 个函数
+#   -memory.txt   结束时比开始时内存增长最多的代码行，以及运行期间的内存峰值
+#   -meta.json    运行参数、用时、结果，以及 Data 目录的文件数、日期数和大小
+# cProfile 只记录调用 profile_run 的线程；多进程解析（--jobs）时子进程中的解析不在结果中。
+# 比较两次运行：python profiling.py compare 基准.pstats 本次.pstats
+PROFILE_DIR = 'profiles'
+PROFILE_TOP = 40
+MEMORY_TOP = 30
+# tracemalloc 为每次分配保存的调用栈层数，层数越多开销越大
+TRACEMALLOC_FRAMES = 1
+
+DATE_PATTERN = re.compile(r'【(\d{8})】')
+
+def corpus_size(data_dir='Data'):
+    """Data 目录的规模：出演表文件数、日期数和总字节数"""
+    files, dates, size = 0, set(), 0
+    try:
+        with os.scandir(data_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith('.txt') and entry.is_file():
+                    files += 1
+                    size += entry.stat().st_size
+                    match = DATE_PATTERN.search(entry.name)
+                    if match:
+                        dates.add(match.group(1))
+    except FileNotFoundError:
+        pass
+    return {'data_dir': data_dir, 'files': files, 'dates': len(dates), 'bytes': size}
+
+def _memory_snapshot():
+    # 不统计 tracemalloc 自身和导入系统的分配
+    return tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    ])
+
+def _format_bytes(size):
+    return f"{size / (1024 * 1024):.1f}MB" if abs(size) >= 1024 * 1024 else f"{size / 1024:.1f}KB"
+
+@contextmanager
+def profile_run(name, data_dir='Data', out_dir=PROFILE_DIR, options=None):
+    """在 with 块中记录性能数据，结束（包括出错和被中断）时写入报告
+
+    yield 一个字典，调用方可以把运行结果放进去，一起写入 -meta.json
+    """
+    corpus = corpus_size(data_dir)
+    started_at = time.strftime("%Y%m%d-%H%M%S")
+    prefix = os.path.join(out_dir, f"{name}-{started_at}-{corpus['files']}files")
+    info = {}
+
+    own_tracemalloc = not tracemalloc.is_tracing()
+    if own_tracemalloc:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    tracemalloc.reset_peak()
+    before = _memory_snapshot()
+    profiler = cProfile.Profile()
+    status = 'ok'
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        yield info
+    except BaseException as e:
+        status = type(e).__name__
+        raise
+    finally:
+        profiler.disable()
+        elapsed = time.perf_counter() - start
+        after = _memory_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if own_tracemalloc:
+            tracemalloc.stop()
+        meta = {
+            'name': name,
+            'started_at': started_at,
+            'elapsed': elapsed,
+            'status': status,
+            'corpus': corpus,
+            'options': options or {},
+            'result': info,
+            'memory': {'current_bytes': current, 'peak_bytes': peak},
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'argv': sys.argv,
+        }
+        try:
+            prefix = _unique_prefix(prefix)
+            write_reports(prefix, profiler, before, after, meta)
+            print(f"性能分析结果已保存: {prefix}.pstats（用时 {elapsed:.1f} 秒，内存峰值 {_format_bytes(peak)}）")
+        except OSError as e:
+            print(f"保存性能分析结果出错: {str(e)}")
+
+def _unique_prefix(prefix):
+    """同一秒内多次运行时在文件名后加序号，不覆盖之前的结果"""
+    candidate, index = prefix, 1
+    while os.path.exists(candidate + '.pstats'):
+        index += 1
+        candidate = f"{prefix}-{index}"
+    return candidate
+
+def write_reports(prefix, profiler, before, after, meta):
+    os.makedirs(os.path.dirname(prefix) or '.', exist_ok=True)
+    profiler.dump_stats(prefix + '.pstats')
+
+    corpus = meta['corpus']
+    header = (f"{meta['name']}  {meta['started_at']}  用时 {meta['elapsed']:.3f}s  状态 {meta['status']}\n"
+              f"Data: {corpus['files']} 个文件，{corpus['dates']} 个日期，{_format_bytes(corpus['bytes'])}\n\n")
+    with open(prefix + '-profile.txt', 'w', encoding='utf-8') as f:
+        f.write(header)
+        stats = pstats.Stats(profiler, stream=f)
+        stats.sort_stats('cumulative').print_stats(PROFILE_TOP)
+        stats.sort_stats('tottime').print_stats(PROFILE_TOP)
+
+    with open(prefix + '-memory.txt', 'w', encoding='utf-8') as f:
+        f.write(header)
+        memory = meta['memory']
+        f.write(f"结束时占用 {_format_bytes(memory['current_bytes'])}，峰值 {_format_bytes(memory['peak_bytes'])}\n")
+        f.write(f"比开始时增长最多的 {MEMORY_TOP} 行：\n")
+        for stat in after.compare_to(before, 'lineno')[:MEMORY_TOP]:
+            f.write(f"{stat}\n")
+
+    with open(prefix + '-meta.json', 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2, default=str)
+
+def _function_name(key):
+    file_name, line, function = key
+    if file_name == '~':
+        return function  # 内置函数
+    return f"{os.path.basename(file_name)}:{line}({function})"
+
+def compare(base_file, new_file, top=30):
+    """比较两次运行的 .pstats，按累计耗时的变化排序，返回 [(函数, 基准秒, 本次秒), ...]"""
+    base = pstats.Stats(base_file).stats
+    new = pstats.Stats(new_file).stats
+    rows = []
+    for key in set(base) | set(new):
+        base_time = base[key][3] if key in base else 0.0
+        new_time = new[key][3] if key in new else 0.0
+        rows.append((_function_name(key), base_time, new_time))
+    rows.sort(key=lambda row: -abs(row[2] - row[1]))
+    return rows[:top]
+
+def _load_meta(pstats_file):
+    meta_file = pstats_file[:-len('.pstats')] + '-meta.json'
+    try:
+        with open(meta_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="比较两次 --profile 运行的性能分析结果")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    compare_parser = subparsers.add_parser('compare', help="按函数累计耗时的变化排序")
+    compare_parser.add_argument('base', help="基准的 .pstats 文件")
+    compare_parser.add_argument('new', help="要比较的 .pstats 文件")
+    compare_parser.add_argument('--top', type=int, default=30)
+    args = parser.parse_args()
+
+    for label, path in (("基准", args.base), ("本次", args.new)):
+        meta = _load_meta(path)
+        if meta:
+            corpus = meta['corpus']
+            print(f"{label}: {meta['name']} {meta['started_at']} 用时 {meta['elapsed']:.3f}s，"
+                  f"Data {corpus['files']} 个文件 / {corpus['dates']} 个日期，"
+                  f"内存峰值 {_format_bytes(meta['memory']['peak_bytes'])}")
+    print(f"\n{'基准':>10}{'本次':>10}{'变化':>10}  函数（累计耗时，秒）")
+    for name, base_time, new_time in compare(args.base, args.new, args.top):
+        print(f"{base_time:>10.3f}{new_time:>10.3f}{new_time - base_time:>+10.3f}  {name}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+# 推送记录数据库，和 timetable.db 分开，避免每次推送都让时间表索引重新加载
+LEDGER_FILE = 'push_ledger.db'
+
+def act_state(activity):
+    """一个正在演出的团体的状态：团体、开始时间和下一个团体"""
+    return [activity['group_name'], activity['start_time'],
+            activity['next_group'], activity['next_start_time']]
+
+class PushLedger:
+    """记录每个Bark Key已推送的各活动状态，重启后依然有效
+
+    每个活动保存已推送过的团体状态列表（JSON），监控只在状态变化时推送：
+    新团体开始、下一个团体变化或活动结束。
+    """
+    def __init__(self, db_file=LEDGER_FILE):
+        self.db_file = db_file
+        self.conn = None
+        self.lock = threading.Lock()
+
+    def _connection(self):
+        # 第一次使用时才打开数据库，导入监控模块不会创建文件；调用方需持有 self.lock
+        # 推送结果在分发器的线程里回写，所以连接允许跨线程使用并用锁保护
+        if self.conn is None:
+            conn = sqlite3.connect(self.db_file, check_same_thread=False)
+            with conn:
+                conn.execute('''CREATE TABLE IF NOT EXISTS push_state (
+                                    bark_key TEXT NOT NULL,
+                                    event_name TEXT NOT NULL,
+                                    state TEXT NOT NULL,
+                                    updated_at TEXT NOT NULL,
+                                    PRIMARY KEY (bark_key, event_name)
+                                )''')
+            self.conn = conn
+        return self.conn
+
+    def load(self, bark_key):
+        """读取一个Bark Key已推送的状态 {活动名: 状态字符串}"""
+        with self.lock:
+            rows = self._connection().execute(
+                "SELECT event_name, state FROM push_state WHERE bark_key = ?", (bark_key,)).fetchall()
+        return dict(rows)
+
+    def diff(self, bark_key, activities, in_progress=()):
+        """和上次推送的状态比较，返回 (状态变化的活动列表, 已结束的活动名列表)
+
+        in_progress 是还没有结束的活动名：两个团体之间的空档里没有正在演出的团体，
+        但活动没有结束，保留推送记录，下一个团体开始时再推送
+        """
+        sent = self.load(bark_key)
+        changed = [activity for activity in activities
+                   if act_state(activity) not in json.loads(sent.get(activity['event_name'], '[]'))]
+        current = {activity['event_name'] for activity in activities}
+        ended = sorted(event_name for event_name in sent
+                       if event_name not in current and event_name not in in_progress)
+        return changed, ended
+
+    def record(self, bark_key, activities=(), ended=()):
+        """推送成功后记录这些团体的状态，删除已结束的活动
+
+        只加入推送成功的团体：同一活动的其他团体推送失败时不会被记录，下次检查时重新推送
+        """
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.lock:
+            conn = self._connection()
+            with conn:
+                for activity in activities:
+                    event_name = activity['event_name']
+                    row = conn.execute("SELECT state FROM push_state WHERE bark_key = ? AND event_name = ?",
+                                       (bark_key, event_name)).fetchone()
+                    state = act_state(activity)
+                    # 同一团体的旧状态（例如下一个团体变了）被替换
+                    acts = [act for act in (json.loads(row[0]) if row else []) if act[:2] != state[:2]]
+                    acts.append(state)
+                    conn.execute("INSERT OR REPLACE INTO push_state VALUES (?, ?, ?, ?)",
+                                 (bark_key, event_name, json.dumps(sorted(acts), ensure_ascii=False), now))
+                conn.executemany(
+                    "DELETE FROM push_state WHERE bark_key = ? AND event_name = ?",
+                    [(bark_key, event_name) for event_name in ended])
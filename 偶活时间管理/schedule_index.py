@@ -0,0 +1,196 @@
+import os
+import time
+import threading
+from bisect import bisect_right
+from datetime import timedelta
+
+import metrics
+import timetable_db
+
+# 活动监控查询"现在/下一个"的耗时，以及从数据库重新加载索引的耗时
+INDEX_QUERY_SECONDS = metrics.histogram('timeing_index_query_seconds', "内存索引查询耗时（秒）", ['query'])
+INDEX_LOAD_SECONDS = metrics.histogram('timeing_index_load_seconds', "从数据库加载内存索引的耗时（秒）")
+
+class EventLineup:
+    """一个活动按开始时间排好序的出演顺序，时间为 UTC 整数分钟"""
+    def __init__(self, event_name, venue, tz_name=timetable_db.DEFAULT_TIMEZONE):
+        self.event_name = event_name
+        self.venue = venue
+        self.tz_name = tz_name  # 显示时间时使用的时区
+        self.groups = []
+        self.starts = []
+        self.ends = []
+        # max_ends[i] 是前 i+1 个团体中最晚的结束时间，向前查找重叠团体时用来提前停止
+        self.max_ends = []
+
+    def append(self, group_name, start_min, end_min):
+        self.groups.append(group_name)
+        self.starts.append(start_min)
+        self.ends.append(end_min)
+        self.max_ends.append(max(end_min, self.max_ends[-1]) if self.max_ends else end_min)
+
+    def current_indexes(self, now_min):
+        """二分查找此刻正在演出的团体下标"""
+        i = bisect_right(self.starts, now_min) - 1
+        found = []
+        while i >= 0 and self.max_ends[i] > now_min:
+            if self.ends[i] > now_min:
+                found.append(i)
+            i -= 1
+        found.reverse()
+        return found
+
+    def in_progress(self, now_min):
+        """活动是否还没有结束：从第一个团体开始到最后一个团体结束，包括团体之间的空档"""
+        return bool(self.starts) and self.starts[0] <= now_min < self.max_ends[-1]
+
+class ScheduleIndex:
+    """活动监控使用的内存时间表索引
+
+    按城市分组保存当天前后的出演顺序，"现在是谁/下一个是谁"通过二分查找回答。
+    只有数据库文件的修改时间（生成时间表、迁移结构都会改变它）或日期变化时才重新从数据库加载；
+    "当天"按 UTC 计算，加载范围前后各留一天，任何时区的活动都包含在内。
+    """
+    def __init__(self, db_file=timetable_db.DB_FILE):
+        self.db_file = db_file
+        self.cities = {}
+        self.boundaries = {}
+        self.signature = None
+        self.loaded_day = None  # 已加载的 UTC 日期，从 1970-01-01 起的天数
+        # 每次重新加载加一，使用者据此判断缓存的派生数据是否过期
+        self.version = 0
+        # 监控主循环和HTTP接口的线程都会查询索引，重新加载时加锁
+        self.lock = threading.Lock()
+
+    def _file_signature(self):
+        # WAL模式下新数据先写进 -wal 文件，所以两个文件都要看；
+        # 只读连接打开时会创建空的 -wal 文件，空文件和不存在一样
+        signature = []
+        for path in (self.db_file, self.db_file + '-wal'):
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size) if stat.st_size else None)
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    @property
+    def loaded_date(self):
+        """已加载的 UTC 日期（date），没有加载过时为 None"""
+        if self.loaded_day is None:
+            return None
+        return (timetable_db.EPOCH + timedelta(days=self.loaded_day)).date()
+
+    def refresh(self, now_min=None):
+        """如有必要重新加载索引，返回是否重新加载；now_min 为 UTC 整数分钟，不指定时为现在"""
+        if now_min is None:
+            now_min = timetable_db.now_minutes()
+        day = now_min // 1440
+        with self.lock:
+            signature = self._file_signature()
+            if signature == self.signature and day == self.loaded_day:
+                return False
+            with INDEX_LOAD_SECONDS.time():
+                self._load(day)
+            self.signature = signature
+            return True
+
+    def invalidate(self):
+        """下次 refresh() 时强制重新加载"""
+        with self.lock:
+            self.signature = None
+
+    def _load(self, day):
+        # 按演出时间而不是活动日期选择：前一天 00:00 到后一天结束之间有演出的活动都完整加载，
+        # 跨午夜或连续多天的通宵活动也包含在内；演出不超过 MAX_ACTIVITY_MINUTES，
+        # 所以用 activities (start_min) 索引扫描一小段时间即可
+        day_start = day * 1440
+        window_start = day_start - 1440 - timetable_db.MAX_ACTIVITY_MINUTES
+        window_end = day_start + 2 * 1440
+
+        try:
+            rows = timetable_db.reader(self.db_file).execute("""
+                SELECT e.id, e.event_name, e.city, e.venue, e.timezone, a.group_name, a.start_min, a.end_min
+                FROM events e
+                JOIN activities a ON a.event_id = e.id
+                WHERE e.id IN (SELECT event_id FROM activities WHERE start_min >= ? AND start_min < ?)
+                ORDER BY e.id, a.start_min, a.id
+            """, (window_start, window_end)).fetchall()
+        except timetable_db.DatabaseNotReady as e:
+            # 还没有生成时间表：索引为空，生成后数据库文件变化时重新加载
+            print(f"{str(e)}，暂时没有活动数据")
+            rows = []
+
+        cities = {}
+        lineups = {}
+        for event_id, event_name, city, venue, tz_name, group_name, start_min, end_min in rows:
+            lineup = lineups.get(event_id)
+            if lineup is None:
+                lineup = lineups[event_id] = EventLineup(event_name, venue, tz_name)
+                cities.setdefault(city, []).append(lineup)
+            lineup.append(group_name, start_min, end_min)
+
+        for lineups_in_city in cities.values():
+            lineups_in_city.sort(key=lambda lineup: lineup.event_name)
+
+        # 每个城市所有开始/结束时间点，排序去重，供调度器计算下一次换场
+        boundaries = {}
+        for city, lineups_in_city in cities.items():
+            points = set()
+            for lineup in lineups_in_city:
+                points.update(lineup.starts)
+                points.update(lineup.ends)
+            boundaries[city] = sorted(points)
+
+        self.cities = cities
+        self.boundaries = boundaries
+        self.loaded_day = day
+        self.version += 1
+        print(f"已加载时间表索引: {len(rows)} 个演出, {len(lineups)} 个活动, {len(cities)} 个城市")
+
+    def upcoming_boundaries(self, city, after_min):
+        """返回指定城市在 after_min 之后的所有开始/结束时间点（整数分钟）"""
+        points = self.boundaries.get(city, [])
+        return points[bisect_right(points, after_min):]
+
+    def transitions_at(self, city, minute):
+        """返回指定城市在 minute 这个时间点开始或结束的演出"""
+        changes = []
+        for lineup in self.cities.get(city, ()):
+            for group_name, start, end in zip(lineup.groups, lineup.starts, lineup.ends):
+                if start == minute:
+                    changes.append({'event_name': lineup.event_name, 'group_name': group_name, 'change': '开始'})
+                elif end == minute:
+                    changes.append({'event_name': lineup.event_name, 'group_name': group_name, 'change': '结束'})
+        return changes
+
+    def events_in_progress(self, city, now_min=None):
+        """返回指定城市在 now_min 还没有结束的活动名集合（正在演出或在两个团体之间的空档）"""
+        if now_min is None:
+            now_min = timetable_db.now_minutes()
+        self.refresh(now_min)
+        return {lineup.event_name for lineup in self.cities.get(city, ()) if lineup.in_progress(now_min)}
+
+    def current_and_next(self, city, now_min=None):
+        """返回指定城市在 now_min（UTC 整数分钟，不指定时为现在）正在进行的活动及下一个团体，
+        格式与 config.get_current_and_next_by_city 相同，时间为活动所在时区的当地时间"""
+        if now_min is None:
+            now_min = timetable_db.now_minutes()
+        self.refresh(now_min)
+
+        start = time.perf_counter()
+        result = []
+        for lineup in self.cities.get(city, ()):
+            for i in lineup.current_indexes(now_min):
+                has_next = i + 1 < len(lineup.groups)
+                result.append({
+                    'event_name': lineup.event_name,
+                    'group_name': lineup.groups[i],
+                    'start_time': timetable_db.format_minutes(lineup.starts[i], "%H:%M", lineup.tz_name),
+                    'end_time': timetable_db.format_minutes(lineup.ends[i], "%H:%M", lineup.tz_name),
+                    'next_group': lineup.groups[i + 1] if has_next else "无",
+                    'next_start_time': timetable_db.format_minutes(lineup.starts[i + 1], "%H:%M", lineup.tz_name) if has_next else "无",
+                    'venue': lineup.venue
+                })
+        INDEX_QUERY_SECONDS.observe(time.perf_counter() - start, query='current_and_next')
+        return result
@@ -0,0 +1,14 @@
+import os
+import sys
+
+import pytest
+
+# 测试直接导入项目目录下的模块
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, PROJECT_DIR)
+
+@pytest.fixture(autouse=True)
+def work_dir(tmp_path, monkeypatch):
+    """每个测试在临时目录中运行，程序使用的相对路径（数据库、配置文件等）都指向这里"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,21 @@
+import pytest
+
+current_activities = pytest.importorskip('current_activities')
+
+def act(event_name, group):
+    return {'event_name': event_name, 'group_name': group, 'start_time': '12:00', 'end_time': '12:30',
+            'next_group': "无", 'next_start_time': None}
+
+def test_title_counts_only_changed_activities():
+    title, body = current_activities.build_batch_message('广州', [act('春季公演', 'A')], ended=['夏日祭'])
+    assert title == "广州 1个活动有更新，1个活动已结束"
+    assert body == "春季公演: A (12:00-12:30)\n夏日祭: 已结束"
+
+def test_title_without_ended():
+    title, _ = current_activities.build_batch_message('广州', [act('春季公演', 'A'), act('夏日祭', 'X')])
+    assert title == "广州 2个活动有更新"
+
+def test_title_with_only_ended():
+    title, body = current_activities.build_batch_message('广州', [], ended=['春季公演'])
+    assert title == "广州 1个活动已结束"
+    assert body == "春季公演: 已结束"
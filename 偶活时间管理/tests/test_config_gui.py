@@ -0,0 +1,53 @@
+import pytest
+
+config_gui = pytest.importorskip('config_gui')
+from user_store import DEFAULT_BARK_KEY, DEFAULT_CITY
+
+class FakeTree:
+    def __init__(self):
+        self.items = []
+        self.selected = None
+
+    def get_children(self):
+        return tuple(self.items)
+
+    def selection_set(self, item):
+        self.selected = item
+
+def make_manager(monkeypatch, answers, users):
+    """不创建窗口的 ConfigManager，对话框依次返回 answers"""
+    manager = config_gui.ConfigManager.__new__(config_gui.ConfigManager)
+    manager.config = {'users': users, 'active_user': next(iter(users))}
+    manager.user_tree = FakeTree()
+    manager.load_user_list = lambda: setattr(manager.user_tree, 'items', list(manager.config['users']))
+    manager.on_user_select = lambda event: None
+    saved = []
+    monkeypatch.setattr(config_gui, 'save_config', lambda config: saved.append(config) or True)
+    answers = iter(answers)
+    monkeypatch.setattr(config_gui.simpledialog, 'askstring', lambda *args, **kwargs: next(answers))
+    monkeypatch.setattr(config_gui.messagebox, 'showerror', lambda *args: pytest.fail(f"showerror{args}"))
+    return manager, saved
+
+def test_add_user_with_empty_fields_uses_defaults(monkeypatch):
+    users = {'2': {'username': '默认用户', 'bark_key': 'key', 'city': '上海', 'enabled': True}}
+    manager, saved = make_manager(monkeypatch, ["新用户", "", None], users)
+
+    manager.add_user()
+
+    assert len(saved) == 1
+    # 已有用户的ID是 '2'，新用户不能覆盖它
+    assert manager.config['users']['2']['username'] == '默认用户'
+    new_user = manager.config['users']['3']
+    assert new_user['username'] == "新用户"
+    assert new_user['bark_key'] == DEFAULT_BARK_KEY
+    assert new_user['city'] == DEFAULT_CITY
+    assert manager.user_tree.selected == '3'
+
+def test_add_user_keeps_entered_values(monkeypatch):
+    users = {'1': {'username': '默认用户', 'bark_key': 'key', 'city': '上海', 'enabled': True}}
+    manager, saved = make_manager(monkeypatch, ["新用户", "abc", "杭州"], users)
+
+    manager.add_user()
+
+    assert manager.config['users']['2'] == {'username': "新用户", 'bark_key': "abc", 'city': "杭州",
+                                            'enabled': True, 'batch_push': True}
@@ -0,0 +1,49 @@
+from generate_timetable import ScheduleItem, build_event_rows
+from timetable_db import MAX_ACTIVITY_MINUTES, day_offsets, format_minutes
+
+def test_same_day():
+    assert day_offsets([('A', '18:30', '19:00'), ('B', '19:00', '19:30')]) == [
+        ('A', 1110, 1140), ('B', 1140, 1170)]
+
+def test_start_more_than_12h_earlier_rolls_to_next_day():
+    assert day_offsets([('A', '22:00', '23:30'), ('B', '00:10', '01:00')]) == [
+        ('A', 1320, 1410), ('B', 1440 + 10, 1440 + 60)]
+
+def test_start_less_than_12h_earlier_stays_on_same_day():
+    # 写错顺序的表不会被当成次日
+    assert day_offsets([('A', '14:00', '14:30'), ('B', '13:00', '13:30')]) == [
+        ('A', 840, 870), ('B', 780, 810)]
+
+def test_all_night_event_spans_several_days():
+    items = [('A', '20:00', '21:00'), ('B', '06:00', '07:00'), ('C', '17:00', '18:00'), ('D', '04:00', '05:00')]
+    assert [start for _, start, _ in day_offsets(items)] == [1200, 1440 + 360, 1440 + 1020, 2880 + 240]
+
+def test_end_before_start_rolls_forward():
+    assert day_offsets([('A', '23:30', '00:30')]) == [('A', 1410, 1470)]
+
+def test_explicit_hour_past_midnight():
+    assert day_offsets([('A', '23:00', '25:30'), ('B', '25:30', '26:00')]) == [
+        ('A', 1380, 1530), ('B', 1530, 1560)]
+
+def test_act_longer_than_12h_is_skipped(capsys):
+    assert day_offsets([('A', '08:00', '21:00'), ('B', '21:00', '21:30')]) == [('B', 1260, 1290)]
+    assert f"超过 {MAX_ACTIVITY_MINUTES // 60} 小时，已忽略" in capsys.readouterr().out
+
+def test_bad_time_is_skipped(capsys):
+    assert day_offsets([('A', '48:00', '49:00'), ('B', '12:00', '12:30')]) == [('B', 720, 750)]
+    assert "格式不正确" in capsys.readouterr().out
+
+def test_build_event_rows_stores_utc_after_midnight():
+    files = {'【20250412】通宵.txt': {
+        'date': '20250412', 'event_name': '通宵', 'city': '东京', 'venue': 'WWW', 'timezone': None,
+        'schedule': [ScheduleItem('A', '23:30', '00:10'), ScheduleItem('B', '00:10', '00:40')],
+    }}
+    [(event_name, event_date, city, venue, tz_name, acts)] = build_event_rows(files, list(files))
+    assert (event_name, event_date, tz_name) == ('通宵', '2025-04-12', 'Asia/Tokyo')
+    assert [(group, format_minutes(start, tz=tz_name), format_minutes(end, tz=tz_name))
+            for group, start, end in acts] == [
+        ('A', '2025-04-12 23:30', '2025-04-13 00:10'),
+        ('B', '2025-04-13 00:10', '2025-04-13 00:40'),
+    ]
+    # 东京是 UTC+9，保存的是 UTC 分钟
+    assert format_minutes(acts[0][1], tz='UTC') == '2025-04-12 14:30'
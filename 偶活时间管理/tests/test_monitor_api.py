@@ -0,0 +1,45 @@
+import urllib.error
+import urllib.request
+
+import pytest
+
+import monitor_api
+
+@pytest.fixture
+def server():
+    calls = []
+    routes = {
+        ('GET', '/status'): lambda query: {'running': True},
+        ('POST', '/shutdown'): lambda query: calls.append('shutdown') or {'ok': True},
+        ('POST', '/reload'): lambda query: calls.append('reload') or {'ok': True},
+    }
+    server = monitor_api.start_server(routes, port=0)
+    server.calls = calls
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def post(server, headers):
+    url = f"http://{monitor_api.API_HOST}:{server.server_port}/shutdown"
+    request = urllib.request.Request(url, method='POST', data=b'', headers=headers)
+    with urllib.request.urlopen(request, timeout=2) as response:
+        return response.status
+
+def test_client_can_post(server):
+    assert monitor_api.call('/shutdown', method='POST', port=server.server_port) == {'ok': True}
+    assert monitor_api.call('/status', port=server.server_port) == {'running': True}
+    assert server.calls == ['shutdown']
+
+def test_request_reload_waits_for_delivery(server):
+    monitor_api.request_reload(port=server.server_port, wait=True)
+    assert server.calls == ['reload']
+
+@pytest.mark.parametrize('headers', [
+    {},  # 网页表单或 fetch 的简单请求不能带自定义请求头
+    {monitor_api.CLIENT_HEADER: '1', 'Origin': 'http://example.com'},
+])
+def test_browser_post_is_rejected(server, headers):
+    with pytest.raises(urllib.error.HTTPError) as excinfo:
+        post(server, headers)
+    assert excinfo.value.code == 403
+    assert server.calls == []
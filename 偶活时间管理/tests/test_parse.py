@@ -0,0 +1,96 @@
+from generate_timetable import DEFAULT_CITY, DEFAULT_VENUE, ScheduleItem, parse_lines
+
+def parse(text):
+    return parse_lines(text.splitlines())
+
+def test_format_one_with_tokutenkai():
+    lineup, counts = parse("""
+城市：广州
+场地：SD
+18:30
+神推Trainee
+18:50
+青苔法则
+20:40
+特典会
+22:30
+特典会
+""")
+    assert lineup.city == '广州'
+    assert lineup.venue == 'SD'
+    assert lineup.timezone is None
+    assert lineup.schedule == [
+        ScheduleItem('神推Trainee', '18:30', '18:50'),
+        ScheduleItem('青苔法则', '18:50', '20:40'),
+        ScheduleItem('特典会', '20:40', '22:30'),
+    ]
+    assert counts == [3, 0]
+
+def test_format_one_last_group_without_end():
+    lineup, _ = parse("19:00\nA\n19:30\nB\n")
+    assert lineup.schedule == [ScheduleItem('A', '19:00', '19:30'), ScheduleItem('B', '19:30', '19:30')]
+
+def test_format_two():
+    lineup, counts = parse("""
+城市：广州
+场地：SD
+11:15~12:45
+Death∞Loop
+13:45~15:15
+SweetyPoison甜蜜毒药
+""")
+    assert lineup.schedule == [
+        ScheduleItem('Death∞Loop', '11:15', '12:45'),
+        ScheduleItem('SweetyPoison甜蜜毒药', '13:45', '15:15'),
+    ]
+    assert counts == [0, 2]
+
+def test_defaults_without_header():
+    lineup, _ = parse("12:00~12:30\nA\n")
+    assert (lineup.city, lineup.venue, lineup.timezone) == (DEFAULT_CITY, DEFAULT_VENUE, None)
+
+def test_timezone_header():
+    lineup, _ = parse("城市：东京\n场地：WWW\n时区：Asia/Tokyo\n18:00~18:20\nA\n")
+    assert (lineup.city, lineup.venue, lineup.timezone) == ('东京', 'WWW', 'Asia/Tokyo')
+    assert lineup.schedule == [ScheduleItem('A', '18:00', '18:20')]
+
+def test_midnight_times_are_kept_as_written():
+    # 跨午夜的顺延在写入数据库时处理（timetable_db.day_offsets），解析时保留原样
+    lineup, _ = parse("23:30\nA\n0:10\nB\n0:40~1:00\nC\n")
+    assert lineup.schedule == [
+        ScheduleItem('A', '23:30', '00:10'),
+        ScheduleItem('B', '00:10', '00:40'),
+        ScheduleItem('C', '00:40', '01:00'),
+    ]
+
+def test_mixed_formats():
+    lineup, counts = parse("""
+城市：上海
+12:00
+A
+12:20~12:40
+B
+13:00
+C
+13:30
+""")
+    # 时间范围同时结束了前一个按时间点开始的团体
+    assert lineup.schedule == [
+        ScheduleItem('A', '12:00', '12:20'),
+        ScheduleItem('B', '12:20', '12:40'),
+        ScheduleItem('C', '13:00', '13:30'),
+    ]
+    assert counts == [2, 1]
+
+def test_full_width_separators_and_short_hours():
+    lineup, _ = parse("城市:广州\n9：30～10：00\nA\n10：00\nB\n10:30\n")
+    assert lineup.city == '广州'
+    assert lineup.schedule == [ScheduleItem('A', '09:30', '10:00'), ScheduleItem('B', '10:00', '10:30')]
+
+def test_orphans_are_ignored(capsys):
+    lineup, _ = parse("A\n12:00~12:30\n13:00~13:30\nB\n14:00~14:30\n")
+    assert lineup.schedule == [ScheduleItem('B', '13:00', '13:30')]
+    out = capsys.readouterr().out
+    assert "团体 A 前面没有时间" in out
+    assert "时间 12:00 后面没有团体名" in out
+    assert "时间 14:00~14:30 后面没有团体名" in out
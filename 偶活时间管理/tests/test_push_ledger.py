@@ -0,0 +1,61 @@
+from push_ledger import PushLedger
+
+KEY = 'key'
+
+def act(event_name, group, start, next_group=None, next_start=None):
+    return {'event_name': event_name, 'group_name': group, 'start_time': start,
+            'next_group': next_group, 'next_start_time': next_start}
+
+def make_ledger(tmp_path):
+    return PushLedger(str(tmp_path / 'push_ledger.db'))
+
+def test_repeat_tick_sends_nothing(tmp_path):
+    ledger = make_ledger(tmp_path)
+    activities = [act('春季公演', 'A', '12:00', 'B', '12:30'), act('夏日祭', 'X', '12:10')]
+    changed, ended = ledger.diff(KEY, activities)
+    assert changed == activities and ended == []
+    ledger.record(KEY, changed, ended)
+    assert ledger.diff(KEY, activities) == ([], [])
+
+def test_changeover_sends_only_changed_acts(tmp_path):
+    ledger = make_ledger(tmp_path)
+    ledger.record(KEY, [act('春季公演', 'A', '12:00', 'B', '12:30'), act('夏日祭', 'X', '12:10')])
+    activities = [act('春季公演', 'B', '12:30', 'C', '13:00'), act('夏日祭', 'X', '12:10')]
+    assert ledger.diff(KEY, activities) == ([activities[0]], [])
+
+def test_next_group_change_is_pushed_again(tmp_path):
+    ledger = make_ledger(tmp_path)
+    ledger.record(KEY, [act('春季公演', 'A', '12:00', 'B', '12:30')])
+    updated = act('春季公演', 'A', '12:00', 'C', '12:40')
+    assert ledger.diff(KEY, [updated]) == ([updated], [])
+    ledger.record(KEY, [updated])
+    assert ledger.diff(KEY, [updated]) == ([], [])
+
+def test_event_that_leaves_is_ended(tmp_path):
+    ledger = make_ledger(tmp_path)
+    ledger.record(KEY, [act('春季公演', 'A', '12:00'), act('夏日祭', 'X', '12:10')])
+    changed, ended = ledger.diff(KEY, [act('夏日祭', 'X', '12:10')])
+    assert changed == [] and ended == ['春季公演']
+    ledger.record(KEY, changed, ended)
+    assert ledger.load(KEY).keys() == {'夏日祭'}
+
+def test_gap_between_acts_is_not_ended(tmp_path):
+    ledger = make_ledger(tmp_path)
+    ledger.record(KEY, [act('春季公演', 'A', '12:00', 'B', '12:40')])
+    assert ledger.diff(KEY, [], in_progress={'春季公演'}) == ([], [])
+
+def test_keys_are_independent(tmp_path):
+    ledger = make_ledger(tmp_path)
+    activities = [act('春季公演', 'A', '12:00')]
+    ledger.record(KEY, activities)
+    assert ledger.diff('other', activities) == (activities, [])
+
+def test_state_survives_reopen(tmp_path):
+    activities = [act('春季公演', 'A', '12:00', 'B', '12:30')]
+    ledger = make_ledger(tmp_path)
+    ledger.record(KEY, activities)
+    ledger.conn.close()
+
+    reopened = make_ledger(tmp_path)
+    assert reopened.diff(KEY, activities) == ([], [])
+    assert reopened.diff(KEY, []) == ([], ['春季公演'])
@@ -0,0 +1,40 @@
+import sqlite3
+
+import pytest
+
+import timetable_db
+
+def make_v0_db(path):
+    """旧版单表结构（user_version = 0）"""
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE activities (event_name TEXT, group_name TEXT, city TEXT, venue TEXT,
+                                             start_time TEXT, end_time TEXT)""")
+    conn.executemany("INSERT INTO activities VALUES (?, ?, ?, ?, ?, ?)", [
+        ('春季公演', 'A组', '广州', '场馆', '2025-04-12 12:00:00', '2025-04-12 12:30:00'),
+        ('春季公演', 'B组', '广州', '场馆', '2025-04-12 12:30:00', '2025-04-12 13:00:00'),
+    ])
+    conn.commit()
+    conn.close()
+
+def test_reader_migrates_old_database(tmp_path):
+    db_file = str(tmp_path / 'timetable.db')
+    make_v0_db(db_file)
+    try:
+        conn = timetable_db.reader(db_file)
+        assert timetable_db.get_schema_version(conn) == timetable_db.SCHEMA_VERSION
+        assert conn.execute("SELECT COUNT(*) FROM activities").fetchone()[0] == 2
+    finally:
+        timetable_db.close_readers()
+
+def test_file_fingerprint_survives_migration(tmp_path):
+    db_file = str(tmp_path / 'timetable.db')
+    make_v0_db(db_file)
+    first = timetable_db.file_fingerprint(db_file)
+    assert first == [1, 2, 1]
+    assert timetable_db.file_fingerprint(db_file) == first
+
+def test_reader_does_not_create_missing_database(tmp_path):
+    db_file = tmp_path / 'timetable.db'
+    with pytest.raises(timetable_db.DatabaseNotReady):
+        timetable_db.reader(str(db_file))
+    assert not db_file.exists()
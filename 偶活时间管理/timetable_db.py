@@ -0,0 +1,450 @@
+import os
+import time
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# 数据库文件路径
+DB_FILE = 'timetable.db'
+
+# 数据库结构版本，保存在 PRAGMA user_version 中
+# 0: 旧版单表 activities (event_name, group_name, start_time, end_time, city, venue)
+# 1: events + activities 两张表，时间以整数分钟保存
+# 2: 跨午夜的演出结束时间顺延到次日（end_min >= start_min），新增 activities (start_min) 索引
+# 3: events 增加 timezone 列，start_min/end_min 从当地钟面时间改为 UTC
+SCHEMA_VERSION = 3
+
+# 表结构模板：完整重建时用同样的结构创建 _staging 表
+EVENTS_TABLE = '''CREATE TABLE IF NOT EXISTS {events} (
+           id INTEGER PRIMARY KEY,
+           event_name TEXT NOT NULL,
+           event_date TEXT NOT NULL,
+           city TEXT NOT NULL,
+           venue TEXT NOT NULL,
+           timezone TEXT NOT NULL DEFAULT 'Asia/Shanghai',
+           UNIQUE (event_name, event_date)
+       )'''
+# city 是 events.city 的冗余副本，用于 (city, start_min, end_min) 索引
+ACTIVITIES_TABLE = '''CREATE TABLE IF NOT EXISTS {activities} (
+           id INTEGER PRIMARY KEY,
+           event_id INTEGER NOT NULL REFERENCES {events} (id),
+           group_name TEXT NOT NULL,
+           city TEXT NOT NULL,
+           start_min INTEGER NOT NULL,
+           end_min INTEGER NOT NULL
+       )'''
+
+INDEXES = [
+    '''CREATE INDEX IF NOT EXISTS idx_activities_city_time
+           ON activities (city, start_min, end_min)''',
+    '''CREATE INDEX IF NOT EXISTS idx_activities_event_start
+           ON activities (event_id, start_min)''',
+    '''CREATE INDEX IF NOT EXISTS idx_events_city
+           ON events (city)''',
+    '''CREATE INDEX IF NOT EXISTS idx_activities_start
+           ON activities (start_min)''',
+]
+
+def table_statements(events='events', activities='activities'):
+    """返回创建 events/activities 两张表的语句，表名可以替换"""
+    return [EVENTS_TABLE.format(events=events),
+            ACTIVITIES_TABLE.format(events=events, activities=activities)]
+
+SCHEMA = table_statements() + INDEXES
+
+# 写入连接使用的 PRAGMA：WAL 模式下读取方在写入期间继续读到提交前的数据，
+# synchronous=NORMAL 在 WAL 模式下只可能丢失最后一次提交，不会损坏数据库
+WRITE_PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -65536",
+    "PRAGMA temp_store = MEMORY",
+]
+
+# 读写模型：只有生成时间表的程序写数据库，同一时间只有一个写入连接；
+# GUI、活动监控等读取方每个线程复用一个长期打开的只读连接，WAL 模式下读取不会被写入阻塞
+BUSY_TIMEOUT = 10  # 等待数据库锁的秒数
+READER_CACHED_STATEMENTS = 256  # 每个只读连接缓存的预编译语句数
+
+_readers = threading.local()
+
+class DatabaseNotReady(RuntimeError):
+    """时间表数据库不存在；只读连接不会创建数据库，需要先生成时间表"""
+
+# 时间的保存方式：数据库中的 start_min/end_min 是从 1970-01-01 00:00 UTC 起的整数分钟，
+# 比较"现在"只需要和 now_minutes() 做整数比较；只有显示和推送时才按活动所在时区换算成当地时间
+EPOCH = datetime(1970, 1, 1)
+
+# 没有指定时区的城市使用的时区
+DEFAULT_TIMEZONE = 'Asia/Shanghai'
+
+# 不在默认时区的城市；出演表也可以用 "时区：Asia/Tokyo" 为单个活动指定时区
+CITY_TIMEZONES = {
+    '东京': 'Asia/Tokyo',
+    '大阪': 'Asia/Tokyo',
+    '名古屋': 'Asia/Tokyo',
+    '福冈': 'Asia/Tokyo',
+    '首尔': 'Asia/Seoul',
+    '台北': 'Asia/Taipei',
+    '香港': 'Asia/Hong_Kong',
+    '澳门': 'Asia/Macau',
+    '新加坡': 'Asia/Singapore',
+    '曼谷': 'Asia/Bangkok',
+    '吉隆坡': 'Asia/Kuala_Lumpur',
+}
+
+_timezones = {}
+
+def get_timezone(name):
+    """返回时区对象，时区名无效时抛出 ValueError"""
+    tz = _timezones.get(name)
+    if tz is None:
+        try:
+            tz = ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError):
+            # Windows 没有系统时区数据库，需要安装 tzdata；默认时区没有夏令时，可以用固定偏移代替
+            if name != DEFAULT_TIMEZONE:
+                raise ValueError(f"未知的时区: {name}")
+            print(f"找不到时区数据，{name} 按 UTC+8 处理，可以运行 pip install tzdata 安装")
+            tz = timezone(timedelta(hours=8), name)
+        _timezones[name] = tz
+    return tz
+
+def city_timezone(city):
+    """返回城市所在的时区名"""
+    return CITY_TIMEZONES.get(city, DEFAULT_TIMEZONE)
+
+def now_minutes():
+    """当前时刻，从 1970-01-01 00:00 UTC 起的整数分钟"""
+    return int(time.time() // 60)
+
+def wall_minutes(value):
+    """把不带时区的 datetime 或 'YYYY-MM-DD HH:MM' 字符串按字面转换为整数分钟（当地钟面时间，不换算时区）"""
+    if isinstance(value, str):
+        value = datetime.strptime(value, "%Y-%m-%d %H:%M")
+    return (value - EPOCH) // timedelta(minutes=1)
+
+def wall_to_utc(wall_min, tz=DEFAULT_TIMEZONE):
+    """把 tz 时区的当地钟面分钟换算为 UTC 分钟，tz 可以是时区名或时区对象"""
+    if isinstance(tz, str):
+        tz = get_timezone(tz)
+    local = (EPOCH + timedelta(minutes=wall_min)).replace(tzinfo=tz)
+    return wall_min - int(local.utcoffset() // timedelta(minutes=1))
+
+def to_minutes(value, tz=DEFAULT_TIMEZONE):
+    """把时间转换为 UTC 整数分钟
+
+    带时区的 datetime 直接换算；不带时区的 datetime 或 'YYYY-MM-DD HH:MM' 字符串视为 tz 时区的当地时间
+    """
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return (value - EPOCH.replace(tzinfo=timezone.utc)) // timedelta(minutes=1)
+    return wall_to_utc(wall_minutes(value), tz)
+
+def from_minutes(minutes, tz=DEFAULT_TIMEZONE):
+    """把 UTC 整数分钟转换为 tz 时区的 datetime（带时区）"""
+    if isinstance(tz, str):
+        tz = get_timezone(tz)
+    return (EPOCH.replace(tzinfo=timezone.utc) + timedelta(minutes=minutes)).astimezone(tz)
+
+def format_minutes(minutes, fmt="%Y-%m-%d %H:%M", tz=DEFAULT_TIMEZONE):
+    """把 UTC 整数分钟格式化为 tz 时区的当地时间字符串"""
+    return from_minutes(minutes, tz).strftime(fmt)
+
+def clock_minutes(time_str, max_hours=24):
+    """把 'HH:MM' 转换为当天的第几分钟，格式不正确时抛出 ValueError
+
+    max_hours=48 时允许 '25:30' 这种深夜写法，表示次日 01:30
+    """
+    hour, minute = time_str.split(':')
+    hour, minute = int(hour), int(minute)
+    if not (0 <= hour < max_hours and 0 <= minute < 60):
+        raise ValueError(f"时间超出范围: {time_str}")
+    return hour * 60 + minute
+
+# 一个演出最长的分钟数：结束时间早于开始时间时视为跨午夜，顺延后超过这个长度的时间视为写错；
+# 范围查询用它限定 start_min 的下界，只扫描索引中的一小段
+MAX_ACTIVITY_MINUTES = 12 * 60
+
+def day_offsets(items):
+    """把出演表中的 (团体名, 开始 HH:MM, 结束 HH:MM) 换算为相对活动日期 00:00 的分钟数
+
+    按出演表顺序处理：开始时间比上一个团体早 12 小时以上时视为进入次日（通宵活动可以连续跨越多天），
+    结束时间早于开始时间时顺延到次日。返回 [(团体名, 开始分钟, 结束分钟), ...]，结果可以超过 1440；
+    时间格式不正确或演出长度超过 MAX_ACTIVITY_MINUTES 的项目打印警告后跳过。
+    """
+    offsets = []
+    day = 0
+    previous = None
+    for group, start_time, end_time in items:
+        try:
+            start = day + clock_minutes(start_time, 48)
+            end_clock = clock_minutes(end_time, 48)
+        except ValueError:
+            print(f"警告: {group} 的时间 {start_time} 或 {end_time} 格式不正确，已忽略")
+            continue
+        while previous is not None and start < previous - MAX_ACTIVITY_MINUTES:
+            start += 1440
+            day += 1440
+        # 结束时间取开始时间之后（或相等）第一个与之对应的时刻
+        end = start + (end_clock - start) % 1440
+        if end - start > MAX_ACTIVITY_MINUTES:
+            print(f"警告: {group} 的时间 {start_time}~{end_time} 超过 {MAX_ACTIVITY_MINUTES // 60} 小时，已忽略")
+            continue
+        offsets.append((group, start, end))
+        previous = start
+    return offsets
+
+def get_schema_version(conn):
+    """读取数据库结构版本"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def _table_columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+def _migrate_from_v0(conn):
+    """把旧版单表 activities 迁移到 events + activities 结构"""
+    print("检测到旧版数据库结构，正在迁移...")
+    conn.execute("ALTER TABLE activities RENAME TO activities_v0")
+    for statement in SCHEMA:
+        conn.execute(statement)
+
+    # 同一天的同名活动合并为一个 event
+    conn.execute('''
+        INSERT INTO events (event_name, event_date, city, venue)
+        SELECT event_name, substr(start_time, 1, 10), MIN(city), MIN(venue)
+        FROM activities_v0
+        WHERE start_time IS NOT NULL
+        GROUP BY event_name, substr(start_time, 1, 10)
+    ''')
+    # strftime('%s') 把时间当作UTC解析，与 wall_minutes 的结果一致（当地钟面时间，之后由 _migrate_to_v3 换算）
+    conn.execute('''
+        INSERT INTO activities (event_id, group_name, city, start_min, end_min)
+        SELECT e.id, o.group_name, e.city,
+               CAST(strftime('%s', o.start_time) AS INTEGER) / 60,
+               CAST(strftime('%s', o.end_time) AS INTEGER) / 60
+        FROM activities_v0 o
+        JOIN events e ON e.event_name = o.event_name
+                     AND e.event_date = substr(o.start_time, 1, 10)
+        WHERE strftime('%s', o.start_time) IS NOT NULL
+          AND strftime('%s', o.end_time) IS NOT NULL
+        ORDER BY o.rowid
+    ''')
+    conn.execute("DROP TABLE activities_v0")
+    count = conn.execute("SELECT COUNT(*) FROM activities").fetchone()[0]
+    print(f"数据库迁移完成，共迁移 {count} 条活动记录")
+
+def _migrate_to_v2(conn):
+    """旧版本把跨午夜演出的结束时间记在开始日期当天，改为次日；完整的修正需要重新生成时间表"""
+    count = conn.execute("UPDATE activities SET end_min = end_min + 1440 WHERE end_min < start_min").rowcount
+    if count:
+        print(f"已修正 {count} 条跨午夜的演出记录")
+
+def _migrate_to_v3(conn):
+    """按每个活动所在城市的时区，把当地钟面时间换算为 UTC"""
+    if 'timezone' not in _table_columns(conn, 'events'):
+        conn.execute(f"ALTER TABLE events ADD COLUMN timezone TEXT NOT NULL DEFAULT '{DEFAULT_TIMEZONE}'")
+    conn.create_function('city_timezone', 1, city_timezone, deterministic=True)
+    conn.create_function('wall_to_utc', 2, wall_to_utc, deterministic=True)
+    conn.execute("UPDATE events SET timezone = city_timezone(city)")
+    count = conn.execute('''UPDATE activities SET
+                                start_min = wall_to_utc(start_min, (SELECT timezone FROM events WHERE id = event_id)),
+                                end_min = wall_to_utc(end_min, (SELECT timezone FROM events WHERE id = event_id))''').rowcount
+    if count:
+        print(f"已将 {count} 条演出记录的时间换算为UTC")
+
+def ensure_schema(conn):
+    """创建数据库表，旧版数据库在第一次打开时自动迁移"""
+    version = get_schema_version(conn)
+    if version == SCHEMA_VERSION:
+        return
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(f"数据库结构版本 {version} 高于程序支持的版本 {SCHEMA_VERSION}，请更新程序")
+
+    # 显式开启写事务，迁移要么全部完成要么全部回滚；拿到写锁后再确认一次版本
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if get_schema_version(conn) < SCHEMA_VERSION:
+            version = get_schema_version(conn)
+            if 'event_name' in _table_columns(conn, 'activities'):
+                _migrate_from_v0(conn)
+            else:
+                for statement in SCHEMA:
+                    conn.execute(statement)
+            if version < 2:
+                _migrate_to_v2(conn)
+            if version < 3:
+                _migrate_to_v3(conn)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def connect(db_file=DB_FILE):
+    """打开数据库连接，并确保数据库结构是最新版本"""
+    conn = sqlite3.connect(db_file)
+    ensure_schema(conn)
+    return conn
+
+def _file_id(db_file):
+    # 数据库文件被删除重建后 inode 会变化，旧连接需要重新打开
+    try:
+        stat = os.stat(db_file)
+        return stat.st_dev, stat.st_ino
+    except FileNotFoundError:
+        return None
+
+def _readonly_uri(db_file):
+    # SQLite URI 中 ? # % 需要转义；Windows 的盘符路径写成 file:///C:/...
+    path = os.path.abspath(db_file).replace('\\', '/')
+    for char, escaped in (('%', '%25'), ('?', '%3f'), ('#', '%23')):
+        path = path.replace(char, escaped)
+    if not path.startswith('/'):
+        path = '/' + path
+    return f"file://{path}?mode=ro"
+
+def _open_readonly(db_file, **options):
+    """以只读方式打开数据库；旧版数据库先用一个短暂的写入连接完成迁移，再重新以只读方式打开"""
+    if not os.path.exists(db_file):
+        raise DatabaseNotReady(f"时间表数据库 {db_file} 不存在，请先生成时间表")
+    for attempt in range(2):
+        # mode=ro：以只读方式打开，文件不存在时不会创建空数据库
+        conn = sqlite3.connect(_readonly_uri(db_file), uri=True, timeout=BUSY_TIMEOUT, **options)
+        try:
+            version = get_schema_version(conn)
+        except sqlite3.DatabaseError:
+            conn.close()
+            raise
+        if version == SCHEMA_VERSION or attempt:
+            break
+        conn.close()
+        if version > SCHEMA_VERSION:
+            raise RuntimeError(f"数据库结构版本 {version} 高于程序支持的版本 {SCHEMA_VERSION}，请更新程序")
+        # 迁移在写事务中进行并再次确认版本，多个读取方同时打开旧数据库时只会迁移一次
+        connect_writer(db_file).close()
+    return conn
+
+def reader(db_file=DB_FILE):
+    """返回当前线程共用的只读连接
+
+    连接在线程内一直保持打开，相同的SQL语句复用预编译结果；每条查询都读取最新提交的数据。
+    调用方不要关闭返回的连接，线程结束前可以调用 close_readers()。
+    数据库不存在时抛出 DatabaseNotReady，不会创建空数据库；旧版数据库在第一次打开时自动迁移。
+    """
+    connections = getattr(_readers, 'connections', None)
+    if connections is None:
+        connections = _readers.connections = {}
+    key = os.path.abspath(db_file)
+    cached = connections.get(key)
+    if cached is not None:
+        conn, file_id = cached
+        if file_id is not None and file_id == _file_id(db_file):
+            return conn
+        conn.close()
+
+    # isolation_level=None：查询不开启事务，不会一直停留在旧的快照上
+    conn = _open_readonly(db_file, isolation_level=None, cached_statements=READER_CACHED_STATEMENTS)
+    connections[key] = (conn, _file_id(db_file))
+    return conn
+
+def fingerprint(conn):
+    """数据库内容的简单指纹 [活动数, 演出数, 最大活动ID]，生成时间表时记在文件清单中，
+    用来确认清单和数据库是同一次生成的结果"""
+    return list(conn.execute("""SELECT (SELECT COUNT(*) FROM events), (SELECT COUNT(*) FROM activities),
+                                       (SELECT COALESCE(MAX(id), 0) FROM events)""").fetchone())
+
+def file_fingerprint(db_file=DB_FILE):
+    """读取数据库的指纹，旧版数据库先迁移（迁移不改变指纹，文件清单仍然有效）；
+    数据库不存在或无法读取时返回 None"""
+    try:
+        conn = _open_readonly(db_file)
+    except (RuntimeError, sqlite3.DatabaseError):
+        return None
+    try:
+        return fingerprint(conn)
+    except sqlite3.DatabaseError:
+        return None
+    finally:
+        conn.close()
+
+def close_readers():
+    """关闭当前线程的所有只读连接"""
+    connections = getattr(_readers, 'connections', None) or {}
+    for conn, _ in connections.values():
+        conn.close()
+    connections.clear()
+
+def connect_writer(db_file=DB_FILE):
+    """打开用于批量写入的连接：WAL 模式、较大的缓存"""
+    # 数据库文件被手动删除时，只读连接仍然打开着旧的 -wal/-shm 文件，
+    # 新数据库如果沿用它们会出现 disk I/O error，所以先删除
+    if not os.path.exists(db_file):
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(db_file + suffix):
+                os.remove(db_file + suffix)
+    conn = sqlite3.connect(db_file, timeout=BUSY_TIMEOUT)
+    for pragma in WRITE_PRAGMAS:
+        conn.execute(pragma)
+    ensure_schema(conn)
+    return conn
+
+def _insert_events(conn, events, first_id, events_table='events', activities_table='activities'):
+    # 活动ID由程序分配，这样活动和演出都可以用 executemany 一次写入
+    event_rows = []
+    activity_rows = []
+    for event_id, (event_name, event_date, city, venue, tz_name, acts) in enumerate(events, first_id):
+        event_rows.append((event_id, event_name, event_date, city, venue, tz_name))
+        activity_rows.extend((event_id, group_name, city, start_min, end_min)
+                             for group_name, start_min, end_min in acts)
+    conn.executemany(f'''INSERT INTO {events_table} (id, event_name, event_date, city, venue, timezone)
+                          VALUES (?, ?, ?, ?, ?, ?)''', event_rows)
+    conn.executemany(f'''INSERT INTO {activities_table} (event_id, group_name, city, start_min, end_min)
+                          VALUES (?, ?, ?, ?, ?)''', activity_rows)
+    return len(activity_rows)
+
+def load_all(conn, events):
+    """完整重建：把所有活动写入 _staging 表，建好索引后在同一个事务中替换正式表
+
+    events 是 (活动名, 日期, 城市, 场地, 时区名, [(团体名, 开始分钟, 结束分钟), ...]) 的列表，
+    时间为 UTC 整数分钟，返回写入的演出数。
+    事务提交前，其他连接（如正在运行的活动监控）读到的始终是替换前的完整数据。
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DROP TABLE IF EXISTS activities_staging")
+        conn.execute("DROP TABLE IF EXISTS events_staging")
+        for statement in table_statements('events_staging', 'activities_staging'):
+            conn.execute(statement)
+        count = _insert_events(conn, events, 1, 'events_staging', 'activities_staging')
+
+        conn.execute("DROP TABLE activities")
+        conn.execute("DROP TABLE events")
+        conn.execute("ALTER TABLE events_staging RENAME TO events")
+        conn.execute("ALTER TABLE activities_staging RENAME TO activities")
+        # 数据写完后再建索引，比边写边维护索引快
+        for statement in INDEXES:
+            conn.execute(statement)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return count
+
+def replace_events(conn, removed, events):
+    """增量更新：删除 removed 中的 (活动名, 日期)，再写入 events，在一个事务中完成
+
+    events 的格式与 load_all 相同，返回写入的演出数。
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany('''DELETE FROM activities WHERE event_id IN
+                            (SELECT id FROM events WHERE event_name = ? AND event_date = ?)''', removed)
+        conn.executemany("DELETE FROM events WHERE event_name = ? AND event_date = ?", removed)
+        first_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM events").fetchone()[0]
+        count = _insert_events(conn, events, first_id)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return count
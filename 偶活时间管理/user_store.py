@@ -0,0 +1,150 @@
+import os
+import json
+import copy
+import threading
+from typing import NamedTuple
+
+# 配置文件路径
+CONFIG_FILE = 'user_config.json'
+
+# 新用户没有填写Bark Key或城市时使用的值
+DEFAULT_BARK_KEY = 'N'
+DEFAULT_CITY = '广州'
+
+# 默认配置
+DEFAULT_CONFIG = {
+    'users': {
+        '1': {
+            'username': '默认用户',
+            'bark_key': DEFAULT_BARK_KEY,
+            'city': DEFAULT_CITY,
+            'enabled': True
+        }
+    },
+    'active_user': '1'  # 默认选中的用户ID
+}
+
+class User(NamedTuple):
+    """一个用户的配置"""
+    user_id: str
+    username: str
+    bark_key: str
+    city: str
+    enabled: bool = True
+    batch_push: bool = True  # 多个活动变化时合并成一条推送
+
+    @classmethod
+    def from_dict(cls, user_id, data):
+        return cls(str(user_id), data['username'], data['bark_key'], data['city'],
+                   data.get('enabled', True), data.get('batch_push', True))
+
+_UNLOADED = object()
+
+class UserStore:
+    """user_config.json 的内存缓存
+
+    文件只解析一次，之后每次 refresh() 只做一次 stat()，修改时间、大小或 inode 变化时才重新读取，
+    所以在配置界面修改用户后，正在运行的活动监控下一次检查时就会生效。
+    """
+    def __init__(self, config_file=CONFIG_FILE):
+        self.config_file = config_file
+        self.lock = threading.Lock()
+        self.signature = _UNLOADED
+        self.config = copy.deepcopy(DEFAULT_CONFIG)
+        self.users = {}
+        # 每次重新加载加一，使用者据此判断缓存的派生数据是否过期
+        self.version = 0
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.config_file)
+            return stat.st_ino, stat.st_mtime_ns, stat.st_size
+        except FileNotFoundError:
+            return None
+
+    def _apply(self, config, signature):
+        self.config = config
+        self.users = {str(user_id): User.from_dict(user_id, data)
+                      for user_id, data in config['users'].items()}
+        self.signature = signature
+        self.version += 1
+
+    def refresh(self):
+        """如有必要重新读取配置文件，返回是否重新加载"""
+        signature = self._file_signature()
+        with self.lock:
+            if signature == self.signature:
+                return False
+            if signature is None:
+                print(f"配置文件 {self.config_file} 不存在，使用默认配置")
+                self._apply(copy.deepcopy(DEFAULT_CONFIG), None)
+                return True
+            try:
+                with open(self.config_file, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+                self._apply(config, signature)
+            except Exception as e:
+                # 保留上次的配置，下次检查时再试
+                print(f"加载配置文件出错: {str(e)}")
+                return False
+            return True
+
+    def invalidate(self):
+        """下次 refresh() 时强制重新读取配置文件"""
+        with self.lock:
+            self.signature = _UNLOADED
+
+    def _loaded(self):
+        if self.signature is _UNLOADED:
+            self.refresh()
+
+    def get(self, user_id):
+        """返回指定用户，不检查文件是否变化"""
+        self._loaded()
+        return self.users[str(user_id)]
+
+    def all_users(self):
+        """返回 {用户ID: User}，不检查文件是否变化"""
+        self._loaded()
+        return dict(self.users)
+
+    def enabled_users(self):
+        """返回已启用的用户 {用户ID: User}"""
+        return {user_id: user for user_id, user in self.all_users().items() if user.enabled}
+
+    def active_user(self):
+        """返回当前默认用户，默认用户无效时返回第一个用户"""
+        self._loaded()
+        users = self.users
+        active_user_id = str(self.config.get('active_user'))
+        if active_user_id in users:
+            return users[active_user_id]
+        return next(iter(users.values()))
+
+    def raw_config(self):
+        """返回配置字典的副本，供配置界面编辑后 save()"""
+        self._loaded()
+        with self.lock:
+            return copy.deepcopy(self.config)
+
+    def save(self, config):
+        """原子保存配置：先写临时文件再替换，其他进程不会读到写了一半的文件"""
+        tmp_file = self.config_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(config, f, ensure_ascii=False, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.config_file)
+        with self.lock:
+            self._apply(copy.deepcopy(config), self._file_signature())
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """获取进程内共用的用户配置缓存"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = UserStore()
+        return _store
@@ -1,22 +1,45 @@
-import os
 import sys
+import logging
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
 import subprocess
 import threading
-import config
 import time
-import json
+import config
+import monitor_api
+from generate_worker import GenerateWorker
+from log_view import LogView
+
+# 活动监控的日志文件，以及界面查询监控状态的间隔（毫秒）
+MONITOR_LOG_FILE = 'activity_monitor.log'
+MONITOR_POLL_MS = 5000
+# 停止监控时等待它完成本轮推送的最长秒数，以及检查进程是否退出的间隔（毫秒）
+MONITOR_STOP_TIMEOUT = 15
+MONITOR_STOP_POLL_MS = 200
+
+# 生成时间管理表各阶段的名称
+GENERATE_STAGES = {
+    'scan': "扫描文件",
+    'parse': "解析文件",
+    'database': "写入数据库",
+    'excel': "生成工作表",
+    'save': "保存文件",
+    'done': "完成",
+}
 
 class TimeingManager:
     def __init__(self, root):
         self.root = root
         self.root.title("时间管理系统")
-        self.root.geometry("700x500")  # 增大窗口尺寸
+        self.root.geometry("700x560")  # 增大窗口尺寸
         self.root.resizable(True, True)
         
         self.activity_process = None
+        self.monitor_running = False
         self.create_widgets()
+        
+        # 生成时间管理表在界面进程内的后台线程中运行，启动时预先加载生成模块
+        self.generate_worker = GenerateWorker(self._on_generate_event)
     
     def create_widgets(self):
         # 创建主框架
@@ -32,16 +55,17 @@ class TimeingManager:
         user_frame.pack(fill='x', padx=10, pady=10)
         
         user = config.get_active_user()
-        ttk.Label(user_frame, text=f"用户名: {user['username']}").grid(row=0, column=0, padx=5, pady=5, sticky='w')
-        ttk.Label(user_frame, text=f"城市: {user['city']}").grid(row=0, column=1, padx=5, pady=5, sticky='w')
-        ttk.Label(user_frame, text=f"Bark Key: {user['bark_key'][:10]}...").grid(row=1, column=0, columnspan=2, padx=5, pady=5, sticky='w')
+        ttk.Label(user_frame, text=f"用户名: {user.username}").grid(row=0, column=0, padx=5, pady=5, sticky='w')
+        ttk.Label(user_frame, text=f"城市: {user.city}").grid(row=0, column=1, padx=5, pady=5, sticky='w')
+        ttk.Label(user_frame, text=f"Bark Key: {user.bark_key[:10]}...").grid(row=1, column=0, columnspan=2, padx=5, pady=5, sticky='w')
         
         # 按钮区域
         button_frame = ttk.Frame(main_frame)
         button_frame.pack(fill='x', padx=10, pady=20)
         
         # 功能按钮
-        ttk.Button(button_frame, text="生成时间管理表", command=self.generate_timetable, width=20).grid(row=0, column=0, padx=10, pady=5)
+        self.generate_button = ttk.Button(button_frame, text="生成时间管理表", command=self.generate_timetable, width=20)
+        self.generate_button.grid(row=0, column=0, padx=10, pady=5)
         ttk.Button(button_frame, text="用户配置管理", command=self.open_config_manager, width=20).grid(row=0, column=1, padx=10, pady=5)
         ttk.Button(button_frame, text="刷新用户信息", command=self.refresh_user_info, width=20).grid(row=1, column=0, padx=10, pady=5)
         
@@ -52,99 +76,93 @@ class TimeingManager:
         # 清空日志按钮
         ttk.Button(button_frame, text="清空日志", command=self.clear_log, width=20).grid(row=2, column=0, columnspan=2, padx=10, pady=5)
         
-        # 状态显示区域
-        status_frame = ttk.LabelFrame(main_frame, text="系统状态")
-        status_frame.pack(fill='both', expand=True, padx=10, pady=10)
-        
-        # 添加包含滚动条的框架
-        text_frame = ttk.Frame(status_frame)
-        text_frame.pack(fill='both', expand=True, padx=5, pady=5)
+        # 性能分析：勾选后生成时间表和之后启动的活动监控都会记录性能数据
+        self.profile_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(button_frame, text="性能分析（结果保存到 profiles 目录）",
+                        variable=self.profile_var).grid(row=3, column=0, columnspan=2, padx=10, pady=5)
         
-        # 垂直滚动条
-        scrollbar_y = ttk.Scrollbar(text_frame)
-        scrollbar_y.pack(side=tk.RIGHT, fill=tk.Y)
+        # 生成时间管理表的进度
+        generate_frame = ttk.LabelFrame(main_frame, text="生成进度")
+        generate_frame.pack(fill='x', padx=10, pady=5)
+        self.generate_progress = ttk.Progressbar(generate_frame, maximum=100)
+        self.generate_progress.pack(fill='x', padx=5, pady=(5, 0))
+        self.generate_status_var = tk.StringVar(value="未开始")
+        ttk.Label(generate_frame, textvariable=self.generate_status_var).pack(fill='x', padx=5, pady=5)
         
-        # 水平滚动条
-        scrollbar_x = ttk.Scrollbar(text_frame, orient='horizontal')
-        scrollbar_x.pack(side=tk.BOTTOM, fill=tk.X)
+        # 活动监控状态，由监控的本地接口提供
+        monitor_frame = ttk.LabelFrame(main_frame, text="活动监控状态")
+        monitor_frame.pack(fill='x', padx=10, pady=5)
+        self.monitor_status_var = tk.StringVar(value="活动监控未运行")
+        ttk.Label(monitor_frame, textvariable=self.monitor_status_var, justify='left').pack(fill='x', padx=5, pady=5)
         
-        # 创建文本框
-        self.status_text = tk.Text(text_frame, wrap=tk.NONE, height=15, width=80,
-                                  yscrollcommand=scrollbar_y.set,
-                                  xscrollcommand=scrollbar_x.set)
-        self.status_text.pack(fill='both', expand=True)
+        # 状态显示区域
+        status_frame = ttk.LabelFrame(main_frame, text="系统状态")
+        status_frame.pack(fill='both', expand=True, padx=10, pady=10)
         
-        # 设置滚动条与文本框的关联
-        scrollbar_y.config(command=self.status_text.yview)
-        scrollbar_x.config(command=self.status_text.xview)
+        # 日志区域：日志先进入队列，由界面线程定时批量显示
+        self.log_view = LogView(self.root, status_frame)
         
         # 初始状态
         self.log_status("系统已启动，请选择操作")
     
-    def log_status(self, message):
-        """添加状态信息到状态显示区域"""
-        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-        
-        self.status_text.config(state=tk.NORMAL)
-        self.status_text.insert(tk.END, f"[{timestamp}] {message}\n")
-        self.status_text.see(tk.END)
-        self.status_text.config(state=tk.DISABLED)
-        
-        # 确保UI刷新
-        self.root.update_idletasks()
+    def log_status(self, message, level=logging.INFO):
+        """添加状态信息到状态显示区域，可以在任何线程中调用"""
+        self.log_view.log(message, level)
     
     def clear_log(self):
         """清空日志信息"""
-        self.status_text.config(state=tk.NORMAL)
-        self.status_text.delete(1.0, tk.END)
-        self.status_text.config(state=tk.DISABLED)
+        self.log_view.clear()
         self.log_status("日志已清空")
     
     def generate_timetable(self):
-        """生成时间管理表"""
-        self.log_status("开始生成时间管理表...")
+        """生成时间管理表；正在生成时再次点击则取消"""
+        if self.generate_worker.is_busy():
+            self.log_status("正在取消生成...")
+            self.generate_worker.cancel()
+            return
         
-        try:
-            # 使用子线程运行以避免阻塞UI
-            threading.Thread(target=self._run_generate_timetable).start()
-        except Exception as e:
-            self.log_status(f"生成时间管理表时出错: {str(e)}")
+        if self.generate_worker.submit(profile=self.profile_var.get()):
+            self.log_status("开始生成时间管理表" + ("（记录性能分析数据）..." if self.profile_var.get() else "..."))
+            self.generate_button.config(text="取消生成")
+            self.generate_progress.config(value=0)
+            self.generate_status_var.set("正在准备...")
     
-    def _run_generate_timetable(self):
-        """在子线程中运行生成时间管理表命令"""
-        try:
-            # 创建一个进程来运行generate_timetable.py
-            process = subprocess.Popen(
-                ["python", "generate_timetable.py"],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                bufsize=1,  # 行缓冲
-                universal_newlines=True
-            )
-            
-            # 实时读取输出
-            for line in process.stdout:
-                line = line.strip()
-                if line:
-                    # 使用copy=True以使lambda捕获变量line的当前值
-                    self.root.after(0, lambda line=line: self.log_status(f"生成时间表: {line}"))
-            
-            # 读取错误输出
-            stderr_output, _ = process.communicate()
-            if stderr_output:
-                self.root.after(0, lambda: self.log_status(f"生成时间管理表出错: {stderr_output}"))
-            
-            # 等待进程结束
-            exit_code = process.wait()
-            if exit_code == 0:
-                self.root.after(0, lambda: self.log_status("时间管理表生成成功"))
+    def _on_generate_event(self, kind, data):
+        """生成线程的事件回调，转到界面线程处理"""
+        if kind == 'log':
+            # 生成过程的逐行输出直接进入日志队列，不为每一行单独安排界面回调
+            level = logging.WARNING if data.startswith("警告") else logging.DEBUG
+            self.log_status(f"生成时间表: {data}", level)
+            return
+        self.root.after(0, lambda: self._show_generate_event(kind, data))
+    
+    def _show_generate_event(self, kind, data):
+        """显示生成进度和结果"""
+        if kind == 'progress':
+            stage = GENERATE_STAGES.get(data.stage, data.stage)
+            if data.total:
+                self.generate_progress.config(value=100 * data.done / data.total)
+                count = f" {data.done}/{data.total}"
             else:
-                self.root.after(0, lambda: self.log_status(f"生成时间管理表失败，退出码: {exit_code}"))
-                
-        except Exception as e:
-            error_msg = str(e)
-            self.root.after(0, lambda error_msg=error_msg: self.log_status(f"生成时间管理表时出错: {error_msg}"))
+                count = ""
+            message = f"：{data.message}" if data.message else ""
+            self.generate_status_var.set(f"{stage}{count}{message}（{data.elapsed:.1f} 秒）")
+            return
+        if kind == 'ready':
+            return
+        
+        if kind == 'done':
+            timings = "，".join(f"{GENERATE_STAGES.get(stage, stage)} {seconds:.1f} 秒"
+                                for stage, seconds in data['timings'].items())
+            self.log_status(f"时间管理表生成成功：解析 {data['parsed']} 个文件，写入 {data['rows']} 条记录，"
+                            f"生成 {data['sheets']} 个工作表，删除 {data['sheets_removed']} 个工作表，用时 {data['elapsed']:.1f} 秒（{timings}）")
+        elif kind == 'cancelled':
+            self.log_status(data, logging.WARNING)
+            self.generate_status_var.set("已取消")
+        else:
+            self.log_status(f"生成时间管理表时出错: {data}", logging.ERROR)
+            self.generate_status_var.set("生成失败")
+        self.generate_button.config(text="生成时间管理表")
     
     def open_config_manager(self):
         """打开用户配置管理"""
@@ -155,7 +173,7 @@ class TimeingManager:
             subprocess.Popen(["python", "config.py"])
         except Exception as e:
             error_msg = str(e)
-            self.log_status(f"打开配置管理器出错: {error_msg}")
+            self.log_status(f"打开配置管理器出错: {error_msg}", logging.ERROR)
     
     def refresh_user_info(self):
         """刷新用户信息"""
@@ -176,17 +194,17 @@ class TimeingManager:
                 widget.destroy()
             
             # 添加新信息
-            ttk.Label(user_frame, text=f"用户名: {user['username']}").grid(row=0, column=0, padx=5, pady=5, sticky='w')
-            ttk.Label(user_frame, text=f"城市: {user['city']}").grid(row=0, column=1, padx=5, pady=5, sticky='w')
-            ttk.Label(user_frame, text=f"Bark Key: {user['bark_key'][:10]}...").grid(row=1, column=0, columnspan=2, padx=5, pady=5, sticky='w')
+            ttk.Label(user_frame, text=f"用户名: {user.username}").grid(row=0, column=0, padx=5, pady=5, sticky='w')
+            ttk.Label(user_frame, text=f"城市: {user.city}").grid(row=0, column=1, padx=5, pady=5, sticky='w')
+            ttk.Label(user_frame, text=f"Bark Key: {user.bark_key[:10]}...").grid(row=1, column=0, columnspan=2, padx=5, pady=5, sticky='w')
             
-            self.log_status(f"已刷新用户信息: {user['username']}")
+            self.log_status(f"已刷新用户信息: {user.username}")
         else:
-            self.log_status("无法找到用户信息框架")
+            self.log_status("无法找到用户信息框架", logging.WARNING)
     
     def toggle_activity_monitor(self):
         """切换活动监控状态"""
-        if self.activity_process is None:
+        if not self.monitor_running:
             # 启动活动监控
             self.start_activity_monitor()
         else:
@@ -194,140 +212,137 @@ class TimeingManager:
             self.stop_activity_monitor()
     
     def start_activity_monitor(self):
-        """启动活动监控"""
+        """启动活动监控服务，之后通过本地接口查询状态"""
         try:
-            # 使用管道捕获输出，而不是新控制台窗口
-            self.activity_process = subprocess.Popen(
-                ["python", "current_activities.py"],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                bufsize=1,  # 行缓冲
-                universal_newlines=True,
-                creationflags=subprocess.CREATE_NO_WINDOW  # 不创建新窗口
-            )
-            
-            # 创建子线程来读取输出
-            self.stdout_thread = threading.Thread(target=self._read_stdout, daemon=True)
-            self.stdout_thread.start()
-            
-            self.stderr_thread = threading.Thread(target=self._read_stderr, daemon=True)
-            self.stderr_thread.start()
+            if monitor_api.is_running():
+                self.log_status("检测到已在运行的活动监控，直接连接")
+            else:
+                # 监控的日志写入文件，界面只通过接口读取结构化状态
+                log_file = open(MONITOR_LOG_FILE, 'a', encoding='utf-8')
+                command = [sys.executable, "current_activities.py"]
+                if self.profile_var.get():
+                    # 性能分析结果在监控退出时保存
+                    command.append("--profile")
+                self.activity_process = subprocess.Popen(
+                    command,
+                    stdout=log_file,
+                    stderr=subprocess.STDOUT,
+                    creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0)  # 不创建新窗口
+                )
+                log_file.close()
+                self.log_status(f"活动监控已启动，日志写入 {MONITOR_LOG_FILE}")
             
-            self.log_status("活动监控已启动")
+            self.monitor_running = True
             self.monitor_button.config(text="停止活动监控")
+            self.root.after(1000, self.poll_monitor)
         except Exception as e:
             error_msg = str(e)
-            self.log_status(f"启动活动监控时出错: {error_msg}")
+            self.log_status(f"启动活动监控时出错: {error_msg}", logging.ERROR)
     
-    def _read_stdout(self):
-        """读取标准输出"""
-        while self.activity_process and not self.activity_process.stdout.closed:
-            try:
-                line = self.activity_process.stdout.readline()
-                if not line:
-                    break
-                line = line.strip()
-                if line:
-                    # 使用lambda捕获变量当前值
-                    self.root.after(0, lambda l=line: self.log_status(f"活动监控: {l}"))
-            except:
-                break
-        
-        # 进程结束后处理
-        if self.activity_process:
-            exit_code = self.activity_process.poll()
-            if exit_code is not None:
-                self.root.after(0, lambda c=exit_code: self.log_status(f"活动监控进程已退出，退出码: {c}"))
-                self.activity_process = None
-                self.root.after(0, lambda: self.monitor_button.config(text="启动活动监控"))
+    def poll_monitor(self):
+        """定期查询活动监控的状态接口"""
+        if not self.monitor_running:
+            return
+        threading.Thread(target=self._fetch_monitor_status, daemon=True).start()
+        self.root.after(MONITOR_POLL_MS, self.poll_monitor)
     
-    def _read_stderr(self):
-        """读取标准错误"""
-        while self.activity_process and not self.activity_process.stderr.closed:
-            try:
-                line = self.activity_process.stderr.readline()
-                if not line:
-                    break
-                line = line.strip()
-                if line:
-                    # 使用lambda捕获变量当前值
-                    self.root.after(0, lambda l=line: self.log_status(f"活动监控错误: {l}"))
-            except:
-                break
-        
-        # 进程结束后处理
-        if self.activity_process:
-            exit_code = self.activity_process.poll()
-            if exit_code is not None:
-                self.root.after(0, lambda c=exit_code: self.log_status(f"活动监控进程已退出，退出码: {c}"))
-                self.activity_process = None
-                self.root.after(0, lambda: self.monitor_button.config(text="启动活动监控"))
+    def _fetch_monitor_status(self):
+        """在子线程中调用接口，结果交给界面线程显示"""
+        try:
+            status = monitor_api.call('/status')
+            now_playing = monitor_api.call('/now')
+        except (OSError, monitor_api.ApiError) as e:
+            error_msg = str(e)
+            exit_code = self.activity_process.poll() if self.activity_process else None
+            self.root.after(0, lambda: self._show_monitor_offline(error_msg, exit_code))
+            return
+        self.root.after(0, lambda: self._show_monitor_status(status, now_playing))
+    
+    def _show_monitor_status(self, status, now_playing):
+        """显示监控状态和各城市正在演出的团体"""
+        if not self.monitor_running:
+            return  # 停止之前发出的查询，结果已经过时
+        lines = [f"订阅城市: {'、'.join(status['cities']) or '无'}    用户数: {status['user_count']}"]
+        if status['next_wakeup']:
+            city = f" ({status['next_city']}换场)" if status['next_city'] else ""
+            lines.append(f"下次检查: {status['next_wakeup']}{city}")
+        if status['last_round']:
+            last_round = status['last_round']
+            lines.append(f"最近一轮推送: {last_round['time']} 成功 {last_round['ok']} 条，失败 {last_round['failed']} 条")
+        for city, activities in now_playing['cities'].items():
+            for activity in activities:
+                lines.append(f"{city} {activity['event_name']}: {activity['group_name']} "
+                             f"({activity['start_time']}-{activity['end_time']})，下一个: {activity['next_group']}")
+        self.monitor_status_var.set("\n".join(lines))
+    
+    def _show_monitor_offline(self, error, exit_code):
+        """接口无法连接时更新界面"""
+        if not self.monitor_running:
+            return  # 正在停止或已经停止，由 _wait_monitor_exit 处理
+        if exit_code is not None:
+            self.log_status(f"活动监控进程已退出，退出码: {exit_code}，详情见 {MONITOR_LOG_FILE}", logging.ERROR)
+            self.activity_process = None
+            self.monitor_running = False
+            self.monitor_button.config(text="启动活动监控")
+            self.monitor_status_var.set("活动监控未运行")
+        else:
+            # 刚启动时接口可能还没准备好
+            self.monitor_status_var.set(f"正在连接活动监控... ({error})")
     
     def stop_activity_monitor(self):
-        """停止活动监控"""
+        """通过接口请求活动监控安全退出；在子线程中发送请求，用 after 检查进程是否退出，界面不会卡住"""
+        self.log_status("正在停止活动监控...")
+        self.monitor_running = False
+        self.monitor_button.config(text="正在停止...", state='disabled')
+        self.monitor_status_var.set("正在停止活动监控...")
+        threading.Thread(target=self._request_shutdown, args=(self.activity_process is None,), daemon=True).start()
+        
         if self.activity_process:
-            try:
-                import signal
-                self.log_status("正在发送停止信号到活动监控...")
-                
-                try:
-                    # 在Windows上，需要特殊处理
-                    if os.name == 'nt':
-                        # 使用Windows特有的方法强制终止
-                        import ctypes
-                        CTRL_BREAK_EVENT = 1
-                        ctypes.windll.kernel32.GenerateConsoleCtrlEvent(CTRL_BREAK_EVENT, self.activity_process.pid)
-                    else:
-                        # 在Unix/Linux上使用SIGINT
-                        self.activity_process.send_signal(signal.SIGINT)
-                        
-                    self.log_status("已发送停止信号到活动监控")
-                    
-                    # 等待进程终止
-                    try:
-                        self.activity_process.wait(timeout=5)
-                        self.log_status("活动监控已正常停止")
-                    except subprocess.TimeoutExpired:
-                        self.log_status("活动监控未响应停止信号，正在强制终止...")
-                        self.activity_process.terminate()
-                        self.log_status("活动监控已强制终止")
-                except Exception as e:
-                    self.log_status(f"发送停止信号时出错: {str(e)}")
-                    self.log_status("正在尝试强制终止...")
-                    self.activity_process.terminate()
-                    self.log_status("活动监控已强制终止")
-                
-                # 重置进程状态
-                self.activity_process = None
-                self.monitor_button.config(text="启动活动监控")
-                
-            except Exception as e:
-                error_msg = str(e)
-                self.log_status(f"停止活动监控时出错: {error_msg}")
-                
-                # 确保进程被终止
-                try:
-                    if self.activity_process:
-                        self.activity_process.kill()
-                        self.activity_process = None
-                        self.log_status("活动监控已强制终止")
-                        self.monitor_button.config(text="启动活动监控")
-                except Exception as e2:
-                    error_msg = str(e2)
-                    self.log_status(f"无法停止活动监控: {error_msg}")
+            # 监控会等本轮推送完成后退出
+            self.stop_deadline = time.monotonic() + MONITOR_STOP_TIMEOUT
+            self.root.after(MONITOR_STOP_POLL_MS, self._wait_monitor_exit)
+        else:
+            self._monitor_stopped()
+    
+    def _request_shutdown(self, attached):
+        """在子线程中调用停止接口，attached 为 True 表示监控不是由界面启动的"""
+        try:
+            monitor_api.call('/shutdown', method='POST')
+        except (OSError, monitor_api.ApiError) as e:
+            error_msg = str(e)
+            self.root.after(0, lambda: self.log_status(f"无法连接活动监控: {error_msg}", logging.WARNING))
+            return
+        if attached:
+            self.root.after(0, lambda: self.log_status("已发送停止请求"))
+    
+    def _wait_monitor_exit(self):
+        """定期检查监控进程是否已经退出，超时后强制终止"""
+        if self.activity_process is None:
+            self._monitor_stopped()
+        elif self.activity_process.poll() is not None:
+            self.log_status("活动监控已正常停止")
+            self._monitor_stopped()
+        elif time.monotonic() >= self.stop_deadline:
+            self.log_status("活动监控未响应停止请求，正在强制终止...", logging.WARNING)
+            self.activity_process.kill()
+            self.log_status("活动监控已强制终止")
+            self._monitor_stopped()
+        else:
+            self.root.after(MONITOR_STOP_POLL_MS, self._wait_monitor_exit)
+    
+    def _monitor_stopped(self):
+        self.activity_process = None
+        self.monitor_button.config(text="启动活动监控", state='normal')
+        self.monitor_status_var.set("活动监控未运行")
 
 def main():
     # 加载用户配置
-    with open('user_config.json', 'r', encoding='utf-8') as f:
-        user_config = json.load(f)
-    
-    for user_id, user in user_config['users'].items():
-        if not user['enabled']:
-            print(f"用户{user['username']}未启用，跳过")
+    for user_id, user in config.get_store().all_users().items():
+        if not user.enabled:
+            print(f"用户{user.username}未启用，跳过")
             continue
         
-        print(f"开始处理用户{user['username']}的活动...")
+        print(f"开始处理用户{user.username}的活动...")
         # ... 调用current_activities等模块，传入user_id ...
     
     root = tk.Tk()